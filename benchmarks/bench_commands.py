@@ -0,0 +1,168 @@
+"""Offline latency benchmarks for the bot's command handlers.
+
+Runs the real handlers from bot.py against generated databases of several sizes,
+with fake Discord contexts and a fake fetch_user, and reports latency percentiles
+and SQL statement counts per command.
+
+    python -m benchmarks.bench_commands
+    python -m benchmarks.bench_commands --sizes 100x1000,10000x1000 --iterations 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.filterwarnings('ignore', message='Using slow pure-python SequenceMatcher')
+
+import bot as challenge_bot
+from database import Database
+from benchmarks import synthetic
+from benchmarks.fakes import FakeContext, FakeGuild, FakeRestClient, FakeUser, StatementCounter
+
+DEFAULT_SIZES = '100x1000,10000x1000,100000x100000'
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Scenario:
+    # Random but repeatable arguments for each command, drawn from the generated data
+
+    def __init__(self, names, users, seed=42):
+        self.rng = random.Random(seed)
+        self.names = names
+        self.users = users
+
+    def user(self):
+        return FakeUser(synthetic.user_id(self.rng.randint(1, self.users)))
+
+    def context(self):
+        return FakeContext(self.user(), FakeGuild())
+
+    def keyword(self):
+        # Mostly words that occur in names, sometimes with a typo
+        word = ' '.join(self.rng.sample(synthetic.WORDS, self.rng.randint(1, 2)))
+        if self.rng.random() < 0.3:
+            i = self.rng.randrange(len(word))
+            word = word[:i] + word[i + 1:]
+        return word
+
+    def challenge_names(self, count):
+        return ', '.join(self.rng.sample(self.names, min(count, len(self.names))))
+
+
+def command_table(scenario):
+    # name -> coroutine function taking a fresh FakeContext
+    return {
+        'leaderboard': lambda ctx: challenge_bot.leaderboard.callback(ctx),
+        'search': lambda ctx: challenge_bot.search.callback(ctx, keyword=scenario.keyword()),
+        'complete': lambda ctx: challenge_bot.complete.callback(ctx, None, challenges=scenario.challenge_names(5)),
+        'user_stats': lambda ctx: challenge_bot.user_stats.callback(ctx, scenario.user(), False),
+        'all_challenges': lambda ctx: challenge_bot.all_challenges.callback(ctx),
+        'remaining': lambda ctx: challenge_bot.remaining.callback(ctx, scenario.user()),
+        'random_challenge': lambda ctx: challenge_bot.random_challenge.callback(ctx, scenario.user(), None),
+    }
+
+
+async def bench_size(challenges, users, iterations, commands, rest_latency):
+    source = synthetic.dataset(challenges, users)
+    workdir = tempfile.mkdtemp(prefix='challenge-bench-')
+    path = os.path.join(workdir, 'challenges.db')
+    shutil.copy(source, path) # complete writes to the database, so work on a copy
+
+    counter = StatementCounter()
+    database = Database(path, on_connect=counter.install)
+    challenge_bot.use_database(database)
+    rest = FakeRestClient(rest_latency).install(challenge_bot.bot)
+
+    names = [row[0] for row in await database.fetchall("SELECT challenge_name FROM challenges ORDER BY RANDOM() LIMIT 2000")]
+    scenario = Scenario(names, users)
+    await database.run(challenge_bot.challenge_indexes[synthetic.GUILD_ID].load) # what on_ready does at startup
+    engine = challenge_bot.progress_engines[synthetic.GUILD_ID]
+    start = time.perf_counter()
+    await engine.load(database)
+    engine_users, engine_bytes = engine.memory()
+    print(f'progress engine: loaded in {time.perf_counter() - start:.2f}s, {engine_users} users, {engine_bytes / max(engine_users, 1):.0f} bytes per user', flush=True)
+
+    results = {}
+    table = command_table(scenario)
+    for name in commands:
+        handler = table[name]
+        await handler(scenario.context()) # warm-up call, not measured
+        latencies = []
+        statements = 0
+        rest_calls = rest.calls
+        for _ in range(iterations):
+            ctx = scenario.context()
+            before = counter.count
+            start = time.perf_counter()
+            await handler(ctx)
+            latencies.append(time.perf_counter() - start)
+            statements += counter.count - before
+        latencies.sort()
+        results[name] = {
+            'p50': percentile(latencies, 0.50) * 1000,
+            'p95': percentile(latencies, 0.95) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'max': latencies[-1] * 1000,
+            'sql': statements / iterations,
+            'rest': (rest.calls - rest_calls) / iterations,
+        }
+
+    database.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def format_results(challenges, users, results):
+    lines = [
+        f'== {challenges} challenges, {users} users ==',
+        f"{'command':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'sql/call':>10}{'rest/call':>10}",
+    ]
+    for name, row in results.items():
+        lines.append(f"{name:<18}{row['p50']:>10.2f}{row['p95']:>10.2f}{row['p99']:>10.2f}{row['max']:>10.2f}{row['sql']:>10.1f}{row['rest']:>10.1f}")
+    return '\n'.join(lines)
+
+
+def parse_sizes(text):
+    sizes = []
+    for item in text.split(','):
+        challenges, users = item.lower().split('x')
+        sizes.append((int(challenges), int(users)))
+    return sizes
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma-separated CHALLENGESxUSERS pairs (default: %(default)s)')
+    parser.add_argument('--iterations', type=int, default=100, help='timed calls per command (default: %(default)s)')
+    parser.add_argument('--commands', default=None, help='comma-separated subset of commands to run')
+    parser.add_argument('--rest-latency', type=float, default=0.05, help='seconds each fake fetch_user call takes (default: %(default)s)')
+    parser.add_argument('--output', default=None, help='also append the report to this file')
+    args = parser.parse_args(argv)
+
+    commands = args.commands.split(',') if args.commands else list(command_table(None))
+    reports = []
+    for challenges, users in parse_sizes(args.sizes):
+        results = await bench_size(challenges, users, args.iterations, commands, args.rest_latency)
+        report = format_results(challenges, users, results)
+        print(report, flush=True)
+        reports.append(report)
+
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write('\n\n'.join(reports) + '\n')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
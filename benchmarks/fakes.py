@@ -0,0 +1,137 @@
+import asyncio
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+# Stand-ins for the pieces of Discord the command handlers touch, so they can run
+# without a gateway connection.
+
+_message_ids = itertools.count(1)
+
+
+class FakeUser(SimpleNamespace):
+    def __init__(self, user_id, name=None):
+        super().__init__(id=user_id, name=name or f'user{user_id}', avatar=None, mention=f'<@{user_id}>')
+
+
+class FakeGuild:
+    def __init__(self, guild_id=1, members=()):
+        self.id = guild_id
+        self._members = {member.id: member for member in members}
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+
+class FakeMessage(SimpleNamespace):
+    async def edit(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def clear_reactions(self):
+        pass
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+        self.acknowledged_at = None # perf_counter() time of the first response, like Discord's 3 second deadline
+
+    def is_done(self):
+        return self._done
+
+    def _acknowledge(self):
+        if not self._done:
+            self._done = True
+            self.acknowledged_at = time.perf_counter()
+
+    async def send_message(self, content=None, *, embed=None, view=None, file=None, ephemeral=False, **kwargs):
+        self._acknowledge()
+        return self._interaction._record(content=content, embed=embed, view=view, file=file)
+
+    async def defer(self, **kwargs):
+        self._acknowledge()
+
+    async def edit_message(self, content=None, *, embed=None, view=None, **kwargs):
+        self._acknowledge()
+        return self._interaction._record(content=content, embed=embed, view=view)
+
+    async def send_autocomplete_result(self, choices):
+        self._acknowledge()
+        self._interaction.autocomplete_choices = choices
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, *, embed=None, view=None, file=None, **kwargs):
+        return self._interaction._record(content=content, embed=embed, view=view, file=file)
+
+
+class FakeContext:
+    """A stand-in for discord.ApplicationContext / discord.Interaction.
+
+    Everything the handler sends is appended to .sent so callers can inspect it.
+    """
+
+    def __init__(self, author, guild=None):
+        self.author = self.user = author
+        self.guild = guild
+        self.guild_id = guild.id if guild is not None else None
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.sent = []
+        self.autocomplete_choices = None
+
+    def _record(self, **kwargs):
+        message = FakeMessage(id=next(_message_ids), **kwargs)
+        self.sent.append(message)
+        return message
+
+    async def respond(self, content=None, **kwargs):
+        if self.response.is_done():
+            return await self.followup.send(content, **kwargs)
+        return await self.response.send_message(content, **kwargs)
+
+    async def defer(self, **kwargs):
+        await self.response.defer(**kwargs)
+
+
+class FakeRestClient:
+    """Replaces bot.fetch_user with a local lookup that takes `latency` seconds and counts calls."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    async def fetch_user(self, user_id):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return FakeUser(int(user_id))
+
+    def install(self, bot):
+        bot.fetch_user = self.fetch_user
+        return self
+
+
+class StatementCounter:
+    # Counts SQL statements through sqlite3's trace callback; pass .install as Database(on_connect=...)
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _trace(self, statement):
+        with self._lock:
+            self.count += 1
+
+    def install(self, conn):
+        conn.set_trace_callback(self._trace)
@@ -0,0 +1,186 @@
+"""Event-day load test: many virtual users firing commands at the same time.
+
+Drives the real handlers from bot.py with fake interactions, arriving at random
+(Poisson) times at a fixed rate, and reports throughput, time to first response
+(Discord's 3 second interaction deadline), total latency, SQLite lock errors and
+event loop lag. Each rate in --rates runs as its own stage, so the report shows
+where the bot stops keeping up.
+
+    python -m benchmarks.loadtest
+    python -m benchmarks.loadtest --size 10000x5000 --rates 100,200,400 --duration 20 --mix complete=5,leaderboard=3,search=2
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import traceback
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+warnings.filterwarnings('ignore', message='Using slow pure-python SequenceMatcher')
+
+import bot as challenge_bot
+from database import Database
+from metrics import Metrics
+from benchmarks import synthetic
+from benchmarks.bench_commands import Scenario, command_table, parse_sizes, percentile
+from benchmarks.fakes import FakeRestClient
+
+DEADLINE = 3.0 # seconds Discord gives a bot to acknowledge an interaction
+
+
+def parse_mix(text):
+    # "complete=5,leaderboard=3" -> {'complete': 5.0, 'leaderboard': 3.0}
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Stage:
+    # Everything recorded while running one arrival rate
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = 0
+        self.finished = 0
+        self.acknowledge_times = []
+        self.latencies = []
+        self.late = 0 # acknowledged after DEADLINE, or never
+        self.lock_errors = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.elapsed = 0.0
+        self.loop = Metrics() # only its loop lag histogram is used
+
+
+async def run_one(stage, handler, ctx):
+    stage.started += 1
+    stage.in_flight += 1
+    stage.peak_in_flight = max(stage.peak_in_flight, stage.in_flight)
+    start = time.perf_counter()
+    try:
+        await handler(ctx)
+    except sqlite3.OperationalError as error:
+        if 'locked' in str(error) or 'busy' in str(error):
+            stage.lock_errors += 1
+        else:
+            stage.errors += 1
+            if stage.errors <= 3:
+                traceback.print_exc()
+    except Exception:
+        stage.errors += 1
+        if stage.errors <= 3:
+            traceback.print_exc()
+    finally:
+        stage.in_flight -= 1
+    stage.finished += 1
+    stage.latencies.append(time.perf_counter() - start)
+    acknowledged_at = ctx.response.acknowledged_at
+    if acknowledged_at is None or acknowledged_at - start > DEADLINE:
+        stage.late += 1
+    if acknowledged_at is not None:
+        stage.acknowledge_times.append(acknowledged_at - start)
+
+
+async def run_stage(rate, duration, mix, table, scenario, rng):
+    stage = Stage(rate)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    lag_task = asyncio.create_task(stage.loop.monitor_loop_lag(interval=0.05))
+    tasks = set()
+
+    start = time.perf_counter()
+    deadline = start + duration
+    next_arrival = start
+    while True:
+        next_arrival += rng.expovariate(rate)
+        if next_arrival >= deadline:
+            break
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        handler = table[rng.choices(names, weights)[0]]
+        task = asyncio.create_task(run_one(stage, handler, scenario.context()))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.wait(tasks) # let the backlog drain; it counts towards the stage's elapsed time
+    stage.elapsed = time.perf_counter() - start
+    lag_task.cancel()
+    return stage
+
+
+def format_stage(stage):
+    acknowledge_times = sorted(stage.acknowledge_times)
+    latencies = sorted(stage.latencies)
+    lag = stage.loop.loop_lag
+    return (
+        f"{stage.rate:>8.0f}{stage.finished / stage.elapsed:>9.1f}{stage.peak_in_flight:>7}"
+        f"{percentile(acknowledge_times, 0.50) * 1000:>9.1f}{percentile(acknowledge_times, 0.95) * 1000:>9.1f}{percentile(acknowledge_times, 0.99) * 1000:>9.1f}"
+        f"{percentile(latencies, 0.99) * 1000:>10.1f}{stage.late:>7}{stage.lock_errors:>7}{stage.errors:>7}"
+        f"{lag.quantile(0.95) * 1000:>9.1f}{lag.max * 1000:>9.1f}"
+    )
+
+
+HEADER = (
+    f"{'rate/s':>8}{'done/s':>9}{'peak':>7}{'ack p50':>9}{'ack p95':>9}{'ack p99':>9}"
+    f"{'total p99':>10}{'late':>7}{'locked':>7}{'errors':>7}{'lag p95':>9}{'lag max':>9}"
+)
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', default='10000x5000', help='CHALLENGESxUSERS of the generated database (default: %(default)s)')
+    parser.add_argument('--rates', default='50,100,200,400', help='comma-separated arrival rates in commands per second, one stage each (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of arrivals per stage (default: %(default)s)')
+    parser.add_argument('--mix', default='complete=5,leaderboard=3,search=2', help='command=weight pairs (default: %(default)s)')
+    parser.add_argument('--pool-size', type=int, default=4, help='database reader threads (default: %(default)s)')
+    parser.add_argument('--rest-latency', type=float, default=0.05, help='seconds each fake fetch_user call takes (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--stop-when-late', action='store_true', help='skip the remaining stages once one misses the deadline or hits a lock error')
+    args = parser.parse_args(argv)
+
+    (challenges, users), = parse_sizes(args.size)
+    mix = parse_mix(args.mix)
+    source = synthetic.dataset(challenges, users)
+    workdir = tempfile.mkdtemp(prefix='challenge-load-')
+    path = os.path.join(workdir, 'challenges.db')
+    shutil.copy(source, path) # complete writes to the database, so work on a copy
+
+    database = Database(path, pool_size=args.pool_size)
+    challenge_bot.use_database(database)
+    FakeRestClient(args.rest_latency).install(challenge_bot.bot)
+    names = [row[0] for row in await database.fetchall("SELECT challenge_name FROM challenges ORDER BY RANDOM() LIMIT 2000")]
+    scenario = Scenario(names, users, seed=args.seed)
+    table = command_table(scenario)
+    unknown = set(mix) - set(table)
+    if unknown:
+        parser.error(f"unknown command(s) in --mix: {', '.join(sorted(unknown))}; choose from {', '.join(table)}")
+    await database.run(challenge_bot.challenge_indexes[synthetic.GUILD_ID].load) # what on_ready does at startup
+    await challenge_bot.progress_engines[synthetic.GUILD_ID].load(database)
+
+    print(f'== {challenges} challenges, {users} virtual users, mix {args.mix}, {args.duration:g}s per stage ==')
+    print(HEADER, flush=True)
+    rng = random.Random(args.seed)
+    try:
+        for rate in (float(rate) for rate in args.rates.split(',')):
+            stage = await run_stage(rate, args.duration, mix, table, scenario, rng)
+            print(format_stage(stage), flush=True)
+            if args.stop_when_late and (stage.late or stage.lock_errors):
+                break
+    finally:
+        database.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
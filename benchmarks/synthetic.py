@@ -0,0 +1,78 @@
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import normalize_name
+from migrations import migrate, migrate_database
+import scores
+
+WORDS = (
+    'run swim climb read cook paint bike hike write sing dance bake code jump walk '
+    'build plant draw film knit learn visit volunteer photograph juggle sketch row'
+).split()
+
+GUILD_ID = 1 # every synthetic challenge belongs to this server (matches fakes.FakeGuild)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def challenge_names(count, rng):
+    # Unique, vaguely realistic names: a few words plus a numbered suffix
+    for i in range(count):
+        yield f"{' '.join(rng.sample(WORDS, 3))} {i}"
+
+
+def build_database(path, challenges, users, completions_per_user=20, seed=1234):
+    """Create a challenges.db at path with the given number of challenges and users.
+
+    Each user completes about completions_per_user random challenges. user_scores is
+    rebuilt from the generated progress so the leaderboard table is consistent.
+    """
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    migrate(conn)
+
+    conn.execute('BEGIN')
+    conn.executemany(
+        "INSERT INTO challenges (guild_id, challenge_name, name_key, points) VALUES (?, ?, ?, ?)",
+        ((GUILD_ID, name, normalize_name(name), rng.choice((5, 10, 25, 50, 100, 150))) for name in challenge_names(challenges, rng)),
+    )
+    now = int(time.time())
+
+    def progress_rows():
+        for n in range(1, users + 1):
+            done = rng.sample(range(1, challenges + 1), min(challenges, max(0, int(rng.gauss(completions_per_user, completions_per_user / 3)))))
+            for challenge_id in done:
+                yield (GUILD_ID, str(user_id(n)), challenge_id, 1, now - rng.randrange(90 * 86400))
+
+    conn.executemany("INSERT INTO user_progress (guild_id, user_id, challenge_id, is_completed, completed_at) VALUES (?, ?, ?, ?, ?)", progress_rows())
+    scores.rebuild_scores(conn, GUILD_ID)
+    conn.execute('COMMIT')
+    conn.execute('ANALYZE')
+    conn.close()
+    return path
+
+
+def dataset(challenges, users, completions_per_user=20):
+    # Path of a generated database of this size, built on first use and reused afterwards
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f'challenges-{challenges}c-{users}u-{completions_per_user}p.db')
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        build_database(path, challenges, users, completions_per_user)
+        print(f'Generated {path} in {time.perf_counter() - start:.1f}s')
+    else:
+        migrate_database(path) # bring a database generated by an older version up to date
+    return path
+
+
+def user_id(n):
+    # The Discord-style id synthetic user number n was given
+    return 10**17 + n
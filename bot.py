@@ -1,16 +1,32 @@
 import discord
+import importlib
 from discord import commands
 from discord.ext import commands
 from discord import Option
 from discord import bot
 from discord import ui
 import os
-import random
-import sqlite3
+import re
+import tempfile
+import time
 import typing
-from fuzzywuzzy import process
 from dotenv import load_dotenv
 import asyncio
+from catalog import Catalog, PerGuild
+from database import DB_PATH, db, normalize_name
+from migrations import LEGACY_GUILD, adopt_legacy_data, migrate_database
+import exporter
+import importer
+import paging
+from metrics import current_command, metrics
+import progress
+import scores
+from names import UserNameResolver
+from pages import ChallengePageSource, RemainingPageSource, SearchPageSource
+from progress_engine import ProgressEngine
+from read_cache import ReadCache
+from render_cache import RenderCache
+from search_index import SearchIndex
 
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
@@ -23,37 +39,147 @@ intents.guilds = True
 intents.members = True
 
 bot = commands.Bot(application_command_prefix='!', intents=intents, help_command=None, case_insensitive=True)
+user_names = UserNameResolver(bot) # shared name cache for the leaderboard
+challenge_indexes = PerGuild(SearchIndex) # fuzzy search over each guild's challenge names, kept in sync by add/delete
+catalogs = PerGuild(Catalog) # each guild's cached catalog totals, reset whenever challenges are added or deleted
+progress_engines = PerGuild(ProgressEngine) # each guild's completions as bitsets, for remaining/random/stats
+render_cache = RenderCache() # rendered list pages, keyed by catalog/progress version
+read_cache = ReadCache() # short-lived leaderboard/stats results, shared by concurrent identical requests
+metrics.register_cache('render', render_cache)
+metrics.register_cache('read', read_cache)
 
 @bot.event
 async def on_ready():
-    print(f'Logged in as {bot.user}')
+    print(f'Logged in as {bot.user} {time.time() - metrics.started_at:.1f}s after start')
     bot.intents.members = True
+    start_background_tasks()
+
+async def warm_up(guilds):
+    """Load what the first commands after a restart would otherwise wait for, all at once.
+
+    For each server: the search index, the progress engine, the catalog totals and the
+    top of the leaderboard with its users' names. Commands that arrive meanwhile share
+    these loads instead of starting their own. Prints how long each step took.
+    """
+    started = time.perf_counter()
+    timings = {} # step -> seconds, summed over servers
+
+    async def timed(step, awaitable):
+        step_started = time.perf_counter()
+        result = await awaitable
+        timings[step] = timings.get(step, 0) + time.perf_counter() - step_started
+        return result
+
+    async def leaderboard_names(guild):
+        def read_top(conn):
+            scores.count_ranked(conn, guild.id)
+            return scores.top_scores(conn, guild.id, 30) # the first three pages
+        top = await timed('score aggregates', db.run(read_top))
+        if not guild.chunked:
+            await timed('member list', guild.chunk())
+        await timed('leaderboard names', user_names.resolve([user_id for user_id, _ in top], guild))
+
+    steps = [timed('fuzzy matcher import', asyncio.to_thread(importlib.import_module, 'fuzzywuzzy.process'))]
+    for guild in guilds:
+        steps += [
+            timed('search index', loaded_index(guild.id)),
+            timed('progress engine', loaded_engine(guild.id)),
+            timed('catalog totals', catalogs[guild.id].totals(db)),
+            leaderboard_names(guild),
+        ]
+    for result in await asyncio.gather(*steps, return_exceptions=True):
+        if isinstance(result, Exception): # a failed step only means that data is loaded on first use instead
+            print(f'Warm-up step failed: {result!r}')
+
+    breakdown = ', '.join(f'{step} {seconds:.2f}s' for step, seconds in timings.items())
+    print(f'Warmed up {len(guilds)} server(s) in {time.perf_counter() - started:.2f}s, {time.time() - metrics.started_at:.1f}s after start: {breakdown}')
+    users, memory = engine_memory()
+    print(f'Progress engines hold {users} user(s) in {memory / 1024:.0f} KB ({memory / max(users, 1):.0f} bytes per user)')
+
+def engine_memory():
+    # (users, bytes) held by the completion bitsets of every loaded progress engine
+    users = memory = 0
+    for engine in progress_engines.values():
+        engine_users, engine_bytes = engine.memory()
+        users += engine_users
+        memory += engine_bytes
+    return users, memory
+
+background_tasks = set()
+
+def start_background_tasks():
+    # on_ready fires again after reconnects, so only start these once
+    if background_tasks:
+        return
+    background_tasks.add(asyncio.create_task(warm_up(bot.guilds)))
+    background_tasks.add(asyncio.create_task(metrics.monitor_loop_lag()))
+    metrics_file = os.getenv('METRICS_FILE') # e.g. for the Prometheus node exporter's textfile collector
+    if metrics_file:
+        background_tasks.add(asyncio.create_task(metrics.write_periodically(metrics_file)))
+
+def guild_of(ctx):
+    # Challenges, progress and scores are kept per server. Commands that use them are
+    # guild_only, so this is never None for them (and None matches no rows if it were).
+    return ctx.guild_id
+
+def challenges_changed(guild_id):
+    # Call after adding or deleting a server's challenges
+    catalogs[guild_id].changed()
+    read_cache.invalidate(guild_id)
+
+def progress_changed(guild_id, user_ids):
+    # Call after changing users' progress or scores in a server
+    catalogs[guild_id].progress_changed(user_ids)
+    read_cache.invalidate(guild_id)
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+    current_command.set(ctx.command.qualified_name) # database work during this command is counted against it
+
+@bot.after_invoke
+async def stop_command_timer(ctx):
+    metrics.observe_command(ctx.command.qualified_name, time.perf_counter() - ctx.started_at)
+
+@bot.listen('on_interaction')
+async def on_page_button(interaction):
+    # Page buttons carry their own state (see paging.py), so a press on any list, even one sent before a restart, is answered here
+    if interaction.guild_id is None: # lists only exist in servers
+        return
+    started_at = time.perf_counter()
+    current_command.set('page_button')
+    if await paging.handle(interaction):
+        metrics.observe_command('page_button', time.perf_counter() - started_at)
 
 @bot.application_command(name='help', help='Display a list of all commands and what they do.')
 async def help(ctx):
-    help_embed = discord.Embed(title="Bot Commands", color=discord.Color.blue())
-    
-    help_embed.description = """
+    await ctx.response.send_message(embed=help_embed)
+
+help_embed = discord.Embed(title="Bot Commands", color=discord.Color.blue()) # the help text never changes, so build it once
+help_embed.description = """
 **!add_challenge / !newChallenge [challenge] [points]**
 _Adds a challenge if it doesn't already exist._
 Example: `!add_challenge "challenge name" 10`
 You can add multiple challenges at once by separating them with commas. 
 Example: `!add_challenge "challenge1", "challenge2", "challenge3" 10`
 
+**/import_challenges [file]**
+_Adds every challenge from an attached CSV or JSON file with name and points columns, skipping ones that already exist._
+
 **/all_challenges**
 _Lists all challenges._
 
 **/user_stats**
 _Get a user's stats._
 
-**!random_challenge / !surpriseMe [user]**
-_Get a random challenge for a user._
+**!random_challenge / !surpriseMe [user] [weighting]**
+_Get a random challenge for a user. Set weighting to `high` or `low` to favor high- or low-points challenges._
 
-**!complete / !finishChallenge [challenge]**
-_Mark a challenge as completed for a user._
+**!complete / !finishChallenge [challenge] [users]**
+_Mark challenges as completed for a user. Separate challenges with commas, and mention extra users (or give their ids) to credit them all at once; role mentions aren't accepted._
 
-**!leaderboard / !showRankings**
-_Show the leaderboard._
+**!leaderboard / !showRankings [period]**
+_Show the leaderboard for today, this week, this season or all time._
 
 **!remaining / !pendingChallenges [user]**
 _Show the remaining challenges for a user._
@@ -65,11 +191,21 @@ _Search for challenges._
 _Delete a challenge._
 Example: `!delete_challenge [challenge name]`
 
+**/export [data] [format] [usernames]**
+_Download the server's progress or leaderboard as a gzip-compressed CSV or JSON Lines file (server managers only)._
+
+**/bot_metrics [write_file]**
+_Show per-command latency, database work and event loop lag, optionally writing them to a Prometheus text file (administrators only)._
+
+**/rebuild_scores [verify_only]**
+_Check the leaderboard totals and rebuild them if they are out of sync (server managers only)._
+
+**/adopt_legacy_data**
+_Move the challenges and progress recorded before the bot kept data per server into this server (administrators only)._
+
 **!help**
 _Display this message._
     """
-    
-    await ctx.response.send_message(embed=help_embed)
 
 
 
@@ -78,7 +214,113 @@ def challenge_formatter(index, challenge_data):
     return f'{index + 1}. **{challenge_name}** for `{points} points`\n'
 
 
+def emoji_formatter(i, data):
+    challenge, points = data
+    emoji = '🏆' if points >= 100 else '🎖️' if points >= 50 else '🎗️'
+    return f'{i+1}. {emoji} **{challenge}** for `{points} points`\n'
+
+
+async def loaded_index(guild_id):
+    # The guild's search index, built on first use (once, however many commands are waiting for it)
+    challenge_index = challenge_indexes[guild_id]
+    if not challenge_index.loaded: # a command arrived before on_ready finished building the index, or the bot joined this server since
+        await read_cache.coalesce(guild_id, ('search_index',), lambda: db.run(challenge_index.load))
+    return challenge_index
+
+
+async def loaded_engine(guild_id):
+    # The guild's progress engine, loaded on first use like the search index
+    engine = progress_engines[guild_id]
+    if not engine.loaded:
+        await read_cache.coalesce(guild_id, ('progress_engine',), lambda: engine.load(db))
+    return engine
+
+
+async def completed_keys(guild_id, user_id):
+    # name_keys of the challenges a user has completed, for leaving them out of suggestions
+    def read(conn):
+        return frozenset(row[0] for row in conn.execute("""
+            SELECT challenges.name_key
+            FROM user_progress
+            INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
+            WHERE user_progress.guild_id = ? AND user_progress.user_id = ? AND user_progress.is_completed = 1
+        """, (guild_id, user_id)))
+    return await read_cache.get(guild_id, ('completed_keys', user_id), lambda: db.run(read))
+
+
+async def suggest_challenges(ctx, typed, exclude=frozenset(), before=''):
+    # Autocomplete choices: names starting with typed, each prefixed with before (the names already entered)
+    try:
+        challenge_index = await asyncio.wait_for(asyncio.shield(loaded_index(guild_of(ctx.interaction))), timeout=2)
+    except asyncio.TimeoutError:
+        return [] # still loading a very large catalog; no suggestions beats missing Discord's deadline
+    choices = (before + name for name in challenge_index.prefix_matches(typed.strip(), exclude=exclude))
+    return [choice for choice in choices if len(choice) <= 100] # Discord's limit for a choice
+
+
+async def challenge_autocomplete(ctx: discord.AutocompleteContext):
+    return await suggest_challenges(ctx, ctx.value or '')
+
+
+async def uncompleted_challenges_autocomplete(ctx: discord.AutocompleteContext):
+    # /complete takes a comma-separated list, so only the part after the last comma is completed.
+    # Challenges the user being credited has already finished, or that are already listed, are left out.
+    entered, comma, typed = (ctx.value or '').rpartition(',')
+    user_id = int(ctx.options.get('user') or ctx.interaction.user.id)
+    exclude = await completed_keys(guild_of(ctx.interaction), user_id)
+    exclude |= {normalize_name(name) for name in entered.split(',') if name.strip()}
+    return await suggest_challenges(ctx, typed, exclude, before=f'{entered}{comma} ' if comma else '')
+
+
+async def render_challenge_list(kind, arg, page, anchor, title, formatter, cache_key, make_source):
+    """Returns (embed, buttons) for one page of a challenge list, or (None, None) if the list is empty.
+
+    cache_key starts with (kind, guild_id). make_source() builds the page source; it is only
+    called when the page isn't in render_cache, and concurrent misses share one render.
+    """
+    cached = render_cache.get((*cache_key, page))
+    if cached is None:
+        async def render(page, anchor):
+            source = make_source()
+            total = render_cache.get((*cache_key, 'count'))
+            if total is None:
+                total = await source.count()
+                render_cache.put((*cache_key, 'count'), total)
+            if not total:
+                return None
+            total_pages = (total + 9) // 10
+            if paging.clamp(page, total_pages) != page: # the list shrank since the button was drawn
+                page, anchor = paging.clamp(page, total_pages), None
+
+            rows = await source.get_page(page, anchor)
+            embed = discord.Embed(
+                title=title,
+                color=discord.Color.blue(),
+                description=''.join(formatter(i, challenge_data) for i, challenge_data in enumerate(rows, start=page * 10)),
+            )
+            embed.set_footer(text=f"Page {page + 1} of {total_pages}")
+            rendered = (embed.to_dict(), page, total_pages, source.page_keys())
+            render_cache.put((*cache_key, page), rendered)
+            return rendered
+
+        cached = await read_cache.coalesce(cache_key[1], (*cache_key, page), lambda: render(page, anchor))
+        if cached is None:
+            return None, None
+
+    embed_dict, page, total_pages, page_keys = cached
+    return discord.Embed.from_dict(embed_dict), paging.buttons(kind, page, total_pages, arg, page_keys)
+
+
+async def send_page(ctx, rendered, empty_message):
+    embed, view = rendered
+    if embed is None:
+        await ctx.response.send_message(empty_message) # use response.send_message instead of send
+    else:
+        await ctx.response.send_message(embed=embed, view=view)
+
+
 @bot.application_command(name='add_challenge', aliases=['newChallenge'], help='Adds challenges: !add_challenge "challenge1", "challenge2", "challenge3" points')
+@discord.guild_only()
 async def add_challenge(ctx, challenges: str, points: int): # use separate arguments for challenges and points
     try:
         challenges = [s.strip().strip('"') for s in challenges.split(',')]  # type: ignore # Strip the quotes from the challenge strings
@@ -86,20 +328,24 @@ async def add_challenge(ctx, challenges: str, points: int): # use separate argum
         await ctx.response.send_message('Invalid input format. Please follow the format: "challenge1", "challenge2", "challenge3" points') # use response.send_message instead of send
         return
 
-    conn = sqlite3.connect('challenges.db')
-    c = conn.cursor()
-
-    added_challenges = []
-    for challenge in challenges:
-        c.execute("SELECT * FROM challenges WHERE LOWER(challenge_name) = ?", (challenge.lower(),))
-        if c.fetchone() is None:
-            c.execute("INSERT INTO challenges (challenge_name, points) VALUES (?, ?)", (challenge, points))
-            added_challenges.append((challenge, points, 'added'))
-        else:
-            added_challenges.append((challenge, points, 'already exists'))
-
-    conn.commit()
-    conn.close()
+    guild_id = guild_of(ctx)
+
+    def insert_challenges(conn):
+        added_challenges = []
+        for challenge in challenges:
+            # The unique (guild_id, name_key) index rejects names that already exist in this server
+            if conn.execute("INSERT OR IGNORE INTO challenges (guild_id, challenge_name, name_key, points) VALUES (?, ?, ?, ?)", (guild_id, challenge, normalize_name(challenge), points)).rowcount:
+                added_challenges.append((challenge, points, 'added'))
+            else:
+                added_challenges.append((challenge, points, 'already exists'))
+        return added_challenges
+
+    added_challenges = await db.transaction(insert_challenges)
+    challenges_changed(guild_id)
+    await progress_engines[guild_id].sync_challenges(db)
+    for challenge, points, status in added_challenges:
+        if status == 'added':
+            challenge_indexes[guild_id].add(challenge, points)
 
     def formatter(i, data):
         challenge, points, status = data
@@ -111,83 +357,101 @@ async def add_challenge(ctx, challenges: str, points: int): # use separate argum
 
 
 
+@bot.application_command(name='import_challenges', help='Adds challenges from an attached CSV or JSON file with name and points columns.')
+@discord.guild_only()
+@discord.commands.default_permissions(manage_messages=True) # only members with manage messages permission can use this command
+async def import_challenges(ctx, file: discord.Attachment):
+    if not file.filename.lower().endswith(('.csv', '.json', '.jsonl')):
+        await ctx.response.send_message('Please attach a .csv, .json or .jsonl file.') # use response.send_message instead of send
+        return
+    await ctx.response.defer() # large files can take longer than the 3 second interaction deadline
+    data = await file.read()
+
+    # Parsing and inserting both happen on the database thread, in one transaction
+    guild_id = guild_of(ctx)
+    try:
+        added_challenges = await db.transaction(importer.import_challenges, guild_id, importer.parse_challenges(data, file.filename))
+    except ValueError as error: # bad encoding, CSV or JSON
+        await ctx.respond(f'Could not read {file.filename}: {error}')
+        return
+    challenges_changed(guild_id)
+    await progress_engines[guild_id].sync_challenges(db)
+
+    for challenge, points, status in added_challenges:
+        if status == 'added':
+            challenge_indexes[guild_id].add(challenge, points)
+    added = sum(1 for _, _, status in added_challenges if status == 'added')
+
+    def formatter(i, data):
+        challenge, points, status = data
+        emoji = '✅' if status == 'added' else '❌'
+        return f'{i+1}. {emoji} **{challenge}** for `{points} points` {status}\n'
+
+    paginator = AddChallengePaginator(ctx, added_challenges, f"Imported challenges: {added} added, {len(added_challenges) - added} skipped", formatter)
+    await paginator.start()
+
+
 @bot.application_command(name='delete_challenge', aliases=['removeChallenge', 'discardChallenge'], help='Deletes a challenge: !delete_challenge "challenge1"')
+@discord.guild_only()
 @discord.commands.default_permissions(manage_messages=True) # only members with manage messages permission can use this command
-async def delete_challenge(ctx, *, challenge: str):
+async def delete_challenge(ctx, *, challenge: Option(str, 'Challenge name', autocomplete=challenge_autocomplete)): # type: ignore
     challenge = challenge.strip('"')  # Strip the quotes from the challenge string
-    conn = sqlite3.connect('challenges.db')
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM challenges WHERE LOWER(challenge_name) = ?", (challenge.lower(),))
-    if c.fetchone() is None:
+    guild_id = guild_of(ctx)
+
+    def remove_challenge(conn):
+        result = conn.execute("SELECT challenge_id, points FROM challenges WHERE guild_id = ? AND name_key = ?", (guild_id, normalize_name(challenge))).fetchone()
+        if result is None:
+            return None
+        challenge_id, points = result
+        scores.remove_challenge_points(conn, guild_id, challenge_id, points) # take the points back from everyone who completed it
+        conn.execute("DELETE FROM user_progress WHERE challenge_id = ?", (challenge_id,))
+        conn.execute("DELETE FROM challenges WHERE challenge_id = ?", (challenge_id,))
+        return challenge_id
+
+    challenge_id = await db.transaction(remove_challenge)
+    if challenge_id is None:
         await ctx.response.send_message(f'The challenge "{challenge}" does not exist.') # use response.send_message instead of send
     else:
-        c.execute("DELETE FROM challenges WHERE LOWER(challenge_name) = ?", (challenge.lower(),))
+        challenge_indexes[guild_id].remove(challenge)
+        progress_engines[guild_id].remove_challenge(challenge_id)
+        challenges_changed(guild_id)
         await ctx.response.send_message(f'The challenge "{challenge}" has been deleted.') # use response.send_message instead of send
-        
-    conn.commit()
-    conn.close()
 
 
 @bot.application_command(name='search', aliases=['findChallenge'], help='Search for challenges: !search keyword')
-async def search(ctx, *, keyword: str):
-    conn = sqlite3.connect('challenges.db')
-    c = conn.cursor()
+@discord.guild_only()
+async def search(ctx, *, keyword: Option(str, 'What to look for', max_length=80)): # type: ignore # the keyword has to fit in the page buttons' custom_id
+    await send_page(ctx, await search_page(ctx, 0, None, keyword), f'No challenges found similar to "{keyword}"')
 
-    # Get all challenge names
-    c.execute("SELECT challenge_name FROM challenges")
-    all_challenges = [row[0] for row in c.fetchall()]
+@paging.renderer('search')
+async def search_page(ctx, page, anchor, keyword):
+    guild_id = guild_of(ctx)
+    challenge_index = await loaded_index(guild_id)
 
-    # Get the top 5 matches to the keyword
-    matches = process.extract(keyword, all_challenges, limit=20)
-
-    # Now get the full data for those top matches
-    results = []
-    for match, score in matches: # type: ignore
-        if score >= 50:  # Set a minimum score
-            c.execute("SELECT challenge_name, points FROM challenges WHERE challenge_name = ?", (match,))
-            results.append(c.fetchone())
-
-    conn.close()
-
-    if results:
-        paginator = ChallengePaginator(ctx, results, f'Challenge search results for "{keyword}"', challenge_formatter)
-        await paginator.start()
-    else:
-        await ctx.response.send_message(f'No challenges found similar to "{keyword}"') # use response.send_message instead of send
+    # Get the top 20 matches to the keyword, with their points, straight from the index (scored on a worker thread)
+    cache_key = ('search', guild_id, catalogs[guild_id].version, keyword)
+    make_source = lambda: SearchPageSource(challenge_index, keyword, limit=20, min_score=50)
+    return await render_challenge_list('search', keyword, page, anchor, f'Challenge search results for "{keyword}"', challenge_formatter, cache_key, make_source)
 
 
 
 @bot.application_command(name='all_challenges', aliases=['showAllChallenges'], help='Lists all challenges.')
+@discord.guild_only()
 async def all_challenges(ctx):
-    conn = sqlite3.connect('challenges.db')
-    c = conn.cursor()
-    c.execute("SELECT challenge_name, points FROM challenges ORDER BY points DESC")
-    all_challenges = c.fetchall()
-    conn.close()
-
-    def formatter(i, data):
-        challenge, points = data
-        emoji = '🏆' if points >= 100 else '🎖️' if points >= 50 else '🎗️'
-        return f'{i+1}. {emoji} **{challenge}** for `{points} points`\n'
-
-    paginator = ChallengePaginator(ctx, all_challenges, "All Challenges", formatter)
-    await paginator.start()
-
-def get_color(completed_points):
-    # Connect to the database
-    conn = sqlite3.connect('challenges.db')
-    c = conn.cursor()
+    await send_page(ctx, await all_challenges_page(ctx, 0, None), 'No challenges exist yet.')
 
-    # Get the total points of all challenges
-    c.execute("SELECT SUM(points) FROM challenges")
-    total_points = c.fetchone()[0]
+@paging.renderer('all_challenges')
+async def all_challenges_page(ctx, page, anchor):
+    guild_id = guild_of(ctx)
+    cache_key = ('all_challenges', guild_id, catalogs[guild_id].version)
+    return await render_challenge_list('all_challenges', None, page, anchor, "All Challenges", emoji_formatter, cache_key, lambda: ChallengePageSource(db, guild_id))
 
-    # Close the connection
-    conn.close()
+async def get_color(guild_id, completed_points):
+    # Get the total points of all of the server's challenges
+    _, total_points = await catalogs[guild_id].totals(db)
 
     # Calculate the percentage of completed points
-    percentage = completed_points / total_points
+    percentage = (completed_points or 0) / total_points if total_points else 0
 
     # Return a different color depending on the percentage
     if percentage >= 0.5: # more than 50% completed
@@ -198,101 +462,36 @@ def get_color(completed_points):
         return discord.Color.red()
 
 @bot.application_command(name='user_stats', aliases=['getUserStats'], help='Get a user\'s stats: !user_stats [user] [detail]')
+@discord.guild_only()
 async def user_stats(ctx, user: discord.User = None, detail: bool = False): # type: ignore
     if user is None:
         user = ctx.author
-    conn = sqlite3.connect('challenges.db')
-    c = conn.cursor()
-    # Get total points
-    c.execute("""
-        SELECT SUM(challenges.points)
-        FROM user_progress
-        INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
-        WHERE user_progress.user_id = ? AND user_progress.is_completed = ?
-    """, (user.id, True))
-    total_points = c.fetchone()[0]
-
-    # Get completed challenges
-    c.execute("""
-        SELECT challenges.challenge_name, challenges.points
-        FROM user_progress
-        INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
-        WHERE user_progress.user_id = ? AND user_progress.is_completed = ?
-    """, (user.id, True))
-    completed_challenges = c.fetchall()
-
-    # Get completed points
-    c.execute("""
-        SELECT SUM(challenges.points)
-        FROM user_progress
-        INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
-        WHERE user_progress.user_id = ? AND user_progress.is_completed = ?
-    """, (user.id, True))
-    completed_points = c.fetchone()[0]
-
-    conn.close()
+    # Get the completed count, points and most recent challenge from the progress engine
+    guild_id = guild_of(ctx)
+    completed_count, completed_points, recent_challenge = (await loaded_engine(guild_id)).user_stats(user.id)
+    if completed_count and recent_challenge is None: # the challenge they completed last has been deleted since
+        _, _, recent_challenge = await read_cache.get(guild_id, ('user_stats', user.id), lambda: db.run(scores.user_stats, guild_id, user.id))
 
     # Create embed
-    color=get_color(completed_points) # use completed points instead of completed challenges
+    color=await get_color(guild_id, completed_points) # use completed points instead of completed challenges
     embed = discord.Embed(title=f"{user.name}'s Stats", color=discord.Color.blue())
     if user.avatar:
         embed.set_thumbnail(url=user.avatar.url)
-    embed.add_field(name="__Total Points__", value=f"{total_points or 0} 🏆", inline=True)
-    embed.add_field(name="__Completed Challenges__", value=f"{len(completed_challenges) or 0} 🏁", inline=True)
+    embed.add_field(name="__Total Points__", value=f"{completed_points or 0} 🏆", inline=True)
+    embed.add_field(name="__Completed Challenges__", value=f"{completed_count or 0} 🏁", inline=True)
     embed.color = color
 
-    if completed_challenges:
-        recent_challenge_name, recent_challenge_points = completed_challenges[-1]
+    if recent_challenge is not None:
+        recent_challenge_name, recent_challenge_points = recent_challenge
 
-        sorted_challenges = sorted(completed_challenges, key=lambda x: x[1], reverse=True)
-        challenges_list = [f"{name} ({points} points)" for name, points in sorted_challenges]
-        
         if detail: # check if the user wants to see the detailed stats
-            paginator = Paginator(challenges_list) # create a paginator object with the challenges list
-            page_number = 1 # start from the first page
-            page_content = paginator.get_page(page_number) # get the content of the first page
-
-            field_value = "\n".join(page_content) # join the content with newlines
-            embed.add_field(name=f"__Challenge List (Page {page_number} of {paginator.get_max_pages()})__", value=f"{field_value}", inline=False) # add the field value to the embed
+            page, total_pages, field_value = await completed_challenge_list(guild_id, user.id, 0)
+            embed.add_field(name=f"__Challenge List (Page {page + 1} of {total_pages})__", value=field_value, inline=False)
 
             # Add a field for the most recent challenge completed
             embed.add_field(name="__Most Recent Challenge Completed__", value=f"{recent_challenge_name} ({recent_challenge_points} points) 🎉", inline=False)
 
-            message = await ctx.response.send_message(embed=embed) # send the message with the embed
-
-            await message.add_reaction("⬅️") # add a reaction for going back a page
-            await message.add_reaction("➡️") # add a reaction for going forward a page
-
-            def check(reaction, user): # define a check function for the reaction event
-                return user == ctx.author and reaction.message.id == message.id and str(reaction.emoji) in ["⬅️", "➡️"] # check if the reaction is from the author and on the same message and is one of the valid emojis
-            
-            while True: # loop until break
-                try:
-                    reaction, user = await bot.wait_for("reaction_add", timeout=60.0, check=check) # wait for a reaction that passes the check within 60 seconds
-                except asyncio.TimeoutError: # if no reaction is added within 60 seconds
-                    await message.clear_reactions() # clear all reactions from the message
-                    break # break the loop
-                else: # if a valid reaction is added
-                    if str(reaction.emoji) == "⬅️": # if the reaction is for going back a page
-                        page_number -= 1 # decrement the page number by 1
-                        if page_number < 1: # if the page number is less than 1
-                            page_number = paginator.get_max_pages() # wrap around to the last page
-                        
-                        page_content = paginator.get_page(page_number) # get the content of the new page
-                        field_value = "\n".join(page_content) # join the content with newlines
-                        embed.set_field_at(2, name=f"__Challenge List (Page {page_number} of {paginator.get_max_pages()})__", value=f"{field_value}") # update the field value in the embed
-                        await message.edit(embed=embed) # edit the message with the new embed
-                        await message.remove_reaction(reaction, user) # remove the reaction from the message
-                    elif str(reaction.emoji) == "➡️": # if the reaction is for going forward a page
-                        page_number += 1 # increment the page number by 1
-                        if page_number > paginator.get_max_pages(): # if the page number is greater than the max pages
-                            page_number = 1 # wrap around to the first page
-                        
-                        page_content = paginator.get_page(page_number) # get the content of the new page
-                        field_value = "\n".join(page_content) # join the content with newlines
-                        embed.set_field_at(2, name=f"__Challenge List (Page {page_number} of {paginator.get_max_pages()})__", value=f"{field_value}") # update the field value in the embed
-                        await message.edit(embed=embed) # edit the message with the new embed
-                        await message.remove_reaction(reaction, user) # remove the reaction from the message
+            await ctx.response.send_message(embed=embed, view=paging.buttons('user_stats', page, total_pages, user.id)) # send the message with the embed
 
         else: # if the user does not want to see the detailed stats
             # Add a field for the most recent challenge completed
@@ -306,24 +505,43 @@ async def user_stats(ctx, user: discord.User = None, detail: bool = False): # ty
 
 
 
+async def completed_challenge_list(guild_id, user_id, page, page_size=10):
+    # One page of the challenges a user has completed, highest points first; returns (page, total pages, field text)
+    rows = await read_cache.get(guild_id, ('completed_challenges', int(user_id), page), lambda: db.fetchall("""
+        SELECT challenges.challenge_name, challenges.points, COUNT(*) OVER ()
+        FROM user_progress
+        INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
+        WHERE user_progress.guild_id = ? AND user_progress.user_id = ? AND user_progress.is_completed = 1
+        ORDER BY challenges.points DESC, challenges.challenge_id
+        LIMIT ? OFFSET ?
+    """, (guild_id, user_id, page_size, page * page_size)))
+    if not rows and page > 0: # the list shrank since the button was drawn
+        return await completed_challenge_list(guild_id, user_id, 0, page_size)
+    if not rows:
+        return 0, 1, "No completed challenges 🙁"
+    total_pages = (rows[0][2] + page_size - 1) // page_size
+    return page, total_pages, "\n".join(f"{name} ({points} points)" for name, points, _ in rows)
+
+@paging.renderer('user_stats')
+async def user_stats_page(interaction, page, anchor, user_id):
+    # Only the challenge list changes; the rest of the stats embed stays as it was sent
+    embed = interaction.message.embeds[0]
+    page, total_pages, field_value = await completed_challenge_list(guild_of(interaction), user_id, page)
+    embed.set_field_at(2, name=f"__Challenge List (Page {page + 1} of {total_pages})__", value=field_value, inline=False)
+    return embed, paging.buttons('user_stats', page, total_pages, user_id)
+
+
 @bot.application_command(name='random_challenge', aliases=['surpriseMe'], help='Get a random challenge for a user: !random_challenge user')
-async def random_challenge(ctx, user: discord.User = None): # type: ignore
+@discord.guild_only()
+async def random_challenge(ctx, user: discord.User = None, weighting: Option(str, 'Favor high-points or low-points challenges', choices=['high', 'low'], required=False, default=None) = None): # type: ignore
     if user is None:
         user = ctx.author
-    conn = sqlite3.connect('challenges.db')
-    c = conn.cursor()
-    c.execute("""
-        SELECT challenge_name, points
-        FROM challenges
-        WHERE challenge_id NOT IN (
-            SELECT challenge_id FROM user_progress WHERE user_id = ? AND is_completed = ?
-        )
-    """, (user.id, True))
-    results = c.fetchall()
-    if results:
-        random_challenge = random.choice(results)
+    guild_id = guild_of(ctx)
+    engine = await loaded_engine(guild_id)
+    random_challenge = engine.pick_random(user.id, weighting) # picked from the user's remaining bitset, no SQL
+    if random_challenge:
         challenge_name, points = random_challenge
-        remaining_challenges = len(results) - 1
+        remaining_challenges = engine.remaining_count(user.id) - 1
 
         # Choose a color for the embed based on the points of the challenge
         if points >= 100:
@@ -342,85 +560,219 @@ async def random_challenge(ctx, user: discord.User = None): # type: ignore
         await ctx.response.send_message(embed=embed) # use response.send_message instead of send
     else:
         await ctx.response.send_message(f'{user.name} has completed all challenges.') # use response.send_message instead of send
-    conn.close()
 
-@bot.application_command(name='complete', aliases=['finishChallenge'], help='Mark a challenge as completed for a user: !complete challenge1, challenge2, challenge3')
-async def complete(ctx, user: typing.Optional[discord.User] = None, *, challenges: str = None): # type: ignore
+USER_TOKEN = re.compile(r'<@!?(\d{15,20})>|(\d{15,20})')
+
+def parse_user_ids(text):
+    # (user ids, unrecognised tokens) from user mentions and bare ids, e.g. "<@123…> 456…".
+    # Role and channel mentions are snowflakes too, so anything else is rejected rather than credited.
+    user_ids, unrecognised = [], []
+    for token in re.findall(r'<[^>]*>|[^\s,<]+', text or ''):
+        match = USER_TOKEN.fullmatch(token)
+        if match is None:
+            unrecognised.append(token)
+        else:
+            user_ids.append(int(match.group(1) or match.group(2)))
+    return user_ids, unrecognised
+
+@bot.application_command(name='complete', aliases=['finishChallenge'], help='Mark challenges as completed for one or more users: !complete challenge1, challenge2 [users]')
+@discord.guild_only()
+async def complete(ctx, user: typing.Optional[discord.User] = None, *, challenges: Option(str, 'Challenge names, separated by commas', autocomplete=uncompleted_challenges_autocomplete, required=False, default=None) = None, users: str = None): # type: ignore
     if user is None:
         user = ctx.author
     if challenges is None:
         await ctx.response.send_message('No challenges provided.') # use response.send_message instead of send
         return
-    challenge_names = [challenge.strip().lower() for challenge in challenges.split(',')]  # Split challenges by comma and strip whitespace
+    challenge_names = challenges.split(',')  # Split challenges by comma
 
-    conn = sqlite3.connect('challenges.db')
-    c = conn.cursor()
+    # Extra users to credit at once, given as mentions or ids, e.g. "@alice @bob"
+    extra_user_ids, unrecognised = parse_user_ids(users)
+    if unrecognised:
+        await ctx.response.send_message(f'Only user mentions and user ids can be credited, not: {", ".join(unrecognised)}') # use response.send_message instead of send
+        return
+    user_ids = list(dict.fromkeys([user.id] + extra_user_ids))
 
-    completed_challenges = []
-    for challenge in challenge_names:
-        c.execute("SELECT challenge_id, points FROM challenges WHERE LOWER(challenge_name) = ?", (challenge,))
-        result = c.fetchone()
-        if result is None:
-            completed_challenges.append((challenge, 'not found'))
-            continue
-        challenge_id, points = result
-        c.execute("INSERT OR IGNORE INTO user_progress (user_id, challenge_id, is_completed) VALUES (?, ?, ?)", (user.id, challenge_id, False)) # type: ignore
-        c.execute("SELECT is_completed FROM user_progress WHERE user_id = ? AND challenge_id = ?", (user.id, challenge_id)) # type: ignore
-        is_completed = c.fetchone()[0]
-        if is_completed:
-            completed_challenges.append((challenge, 'already completed'))
-            continue
-        c.execute("UPDATE user_progress SET is_completed = ? WHERE user_id = ? AND challenge_id = ?", (True, user.id, challenge_id)) # type: ignore
-        completed_challenges.append((challenge, 'completed'))
-
-    conn.commit()
-    conn.close()
+    guild_id = guild_of(ctx)
+    results = await db.transaction(progress.complete_challenges, guild_id, user_ids, challenge_names)
+    for user_id in user_ids:
+        progress_engines[guild_id].complete(user_id, [challenge_id for completed_user_id, _, status, challenge_id in results if completed_user_id == user_id and status == 'completed'])
+    progress_changed(guild_id, user_ids)
 
-    def formatter(i, data):
-        challenge, status = data
-        emoji = '✅' if status == 'completed' else '❌'
-        return f'{i+1}. {emoji} **{challenge}** {status}\n'
+    if len(user_ids) == 1:
+        completed_challenges = [(challenge, status) for _, challenge, status, _ in results]
+
+        def formatter(i, data):
+            challenge, status = data
+            emoji = '✅' if status == 'completed' else '❌'
+            return f'{i+1}. {emoji} **{challenge}** {status}\n'
+    else:
+        completed_challenges = [(user_id, challenge, status) for user_id, challenge, status, _ in results]
+
+        def formatter(i, data):
+            user_id, challenge, status = data
+            emoji = '✅' if status == 'completed' else '❌'
+            return f'{i+1}. {emoji} <@{user_id}> **{challenge}** {status}\n'
 
     paginator = CompleteChallengePaginator(ctx, completed_challenges, "Completed Challenges", formatter)
     await paginator.start()
 
 
-@bot.application_command(name='leaderboard', aliases=['showRankings'], help='Show the leaderboard: !leaderboard')
-async def leaderboard(ctx):
-    conn = sqlite3.connect('challenges.db')
-    c = conn.cursor()
-    c.execute("""
-        SELECT user_id, SUM(challenges.points)
-        FROM user_progress
-        INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
-        WHERE user_progress.is_completed = ?
-        GROUP BY user_id
-        ORDER BY SUM(challenges.points) DESC
-    """, (True,))
-    results = c.fetchall()
-    conn.close()
-    leaderboard_embed = discord.Embed(title="Leaderboard", color=discord.Color.blue())
+LEADERBOARD_PERIODS = {'day': 'today', 'week': 'this week', 'season': 'this season', 'all': 'all time'}
+
+@bot.application_command(name='leaderboard', aliases=['showRankings'], help='Show the leaderboard: !leaderboard [period]')
+@discord.guild_only()
+async def leaderboard(ctx, period: Option(str, 'Points earned today, this week, this season or all time', choices=list(LEADERBOARD_PERIODS), required=False, default='all') = 'all'): # type: ignore
+    embed, view = await leaderboard_page(ctx, 0, None, period)
+    await ctx.response.send_message(embed=embed, view=view)
+
+@paging.renderer('leaderboard')
+async def leaderboard_page(ctx, page, anchor, period='all'):
+    page_size = 10
+    guild_id = guild_of(ctx)
+    if period not in LEADERBOARD_PERIODS:
+        period = 'all'
+    window = scores.current_window(period) # windowed boards read the rollup of the current day, week or season
+
+    def read_page(conn, page):
+        # Only the users on this page are read
+        total_users = scores.count_ranked(conn, guild_id, window)
+        page = paging.clamp(page, (total_users + page_size - 1) // page_size)
+        return total_users, page, scores.top_scores(conn, guild_id, page_size, page * page_size, window)
+
+    async def load_page(page):
+        total_users, page, results = await db.run(read_page, page)
+        names = await user_names.resolve([user_id for user_id, _ in results], ctx.guild)
+        return total_users, page, results, names
+
+    # Everyone asking for this page shares one read and one round of name lookups
+    total_users, page, results, names = await read_cache.get(guild_id, ('leaderboard', window, page), lambda: load_page(page))
+    my_rank = await read_cache.get(guild_id, ('rank', window, ctx.user.id), lambda: db.run(scores.user_rank, guild_id, ctx.user.id, window))
+
+    title = "Leaderboard" if window is None else f"Leaderboard: {LEADERBOARD_PERIODS[period].title()}"
+    leaderboard_embed = discord.Embed(title=title, color=discord.Color.blue())
 
     # Define a dictionary of emojis and colors for each rank
     rank_emojis = {1: '👑', 2: '🥈', 3: '🥉'}
     rank_colors = {1: discord.Color.gold(), 2: discord.Color.light_gray(), 3: discord.Color.dark_orange()}
 
-    for i, (user_id, total_points) in enumerate(results, start=1):
-        user = await bot.fetch_user(user_id)
-
+    for i, (user_id, total_points) in enumerate(results, start=page * page_size + 1):
         # Get the emoji and color for the current rank, or use default values if not in the dictionary
         emoji = rank_emojis.get(i, '⭐')
         color = rank_colors.get(i, discord.Color.blue())
 
         # Create a field for each user with their name, points, and emoji
-        leaderboard_embed.add_field(name=f"{emoji} {user.name}", value=f"{total_points or 0} points", inline=False)
+        leaderboard_embed.add_field(name=f"{emoji} {names[user_id]}", value=f"{total_points or 0} points", inline=False)
 
         # Change the color of the embed to match the current rank
         leaderboard_embed.color = color
 
-    if len(results) == 0:
-        leaderboard_embed.description = 'The leaderboard is empty.'
-    await ctx.response.send_message(embed=leaderboard_embed) # use response.send_message instead of send
+    if total_users == 0:
+        leaderboard_embed.description = 'The leaderboard is empty.' if window is None else f'Nobody has completed a challenge {LEADERBOARD_PERIODS[period]} yet.'
+        return leaderboard_embed, None
+
+    total_pages = (total_users + page_size - 1) // page_size
+    footer = f"Page {page + 1} of {total_pages}"
+    if my_rank is not None:
+        rank, points = my_rank
+        footer += f" • Your rank: #{rank} with {points} points" # the rank of whoever is looking at this page
+    leaderboard_embed.set_footer(text=footer)
+    return leaderboard_embed, paging.buttons('leaderboard', page, total_pages, period)
+
+
+@bot.application_command(name='rebuild_scores', help='Check the leaderboard totals against the progress table and rebuild them: !rebuild_scores [verify_only]')
+@discord.guild_only()
+@discord.commands.default_permissions(manage_guild=True) # only server managers can use this command
+async def rebuild_scores(ctx, verify_only: bool = False):
+    guild_id = guild_of(ctx)
+    # All-time totals and the day/week/season rollups drift independently, so check both
+    mismatches = await db.run(scores.verify_scores, guild_id)
+    rollup_mismatches = await db.run(scores.verify_rollups, guild_id)
+    checked = f'{len(mismatches)} user total(s) and {len(rollup_mismatches)} day/week/season total(s) out of sync'
+    if verify_only or not (mismatches or rollup_mismatches):
+        await ctx.response.send_message(f'Leaderboard totals checked: {checked}.')
+        return
+    users = await db.transaction(scores.rebuild_scores, guild_id)
+    read_cache.invalidate(guild_id)
+    await ctx.response.send_message(f'Fixed {checked}; rebuilt totals for {users} user(s).')
+
+@bot.application_command(name='export', help='Download the server\'s progress or leaderboard as a compressed CSV or JSON Lines file: !export [data] [format] [usernames]')
+@discord.guild_only() # default_permissions isn't enforced in DMs
+@discord.commands.default_permissions(manage_guild=True) # only server managers can use this command
+async def export(
+    ctx,
+    data: Option(str, 'What to export', choices=list(exporter.EXPORTS), required=False, default='leaderboard') = 'leaderboard', # type: ignore
+    file_format: Option(str, 'File format', name='format', choices=list(exporter.FORMATS), required=False, default='csv') = 'csv', # type: ignore
+    usernames: Option(bool, 'Add a username column, filled from names the bot already knows', required=False, default=False) = False, # type: ignore
+):
+    await ctx.response.defer() # big servers can take longer than the 3 second interaction deadline
+    guild_id = guild_of(ctx)
+    guild = ctx.guild
+    name_of = (lambda user_id: user_names.peek(int(user_id), guild)) if usernames else None
+    filename = f'{data}-{guild_id}.{file_format}.gz'
+
+    # The file is written on a database thread straight from the cursor, then uploaded from disk
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, filename)
+        rows = await db.run(exporter.export, guild_id, data, file_format, path, name_of)
+        size = os.path.getsize(path)
+        limit = guild.filesize_limit if guild is not None else 10 * 1024 * 1024
+        if size > limit:
+            await ctx.respond(f'The export is {size / 1024 / 1024:.1f} MB, more than the {limit / 1024 / 1024:.0f} MB upload limit.')
+            return
+        await ctx.respond(f'Exported {rows} row(s).', file=discord.File(path, filename=filename))
+
+@bot.application_command(name='bot_metrics', help='Show command latency, database and event loop metrics: !bot_metrics [write_file]')
+@discord.guild_only() # default_permissions isn't enforced in DMs
+@discord.commands.default_permissions(administrator=True) # only administrators can use this command
+async def bot_metrics(ctx, write_file: bool = False):
+    embed = discord.Embed(title="Bot Metrics", color=discord.Color.blue())
+    uptime = int(time.time() - metrics.started_at)
+    embed.description = f"Uptime: {uptime // 3600}h {uptime % 3600 // 60}m"
+
+    # Slowest commands first
+    commands_by_p95 = sorted(metrics.commands.items(), key=lambda item: item[1].quantile(0.95), reverse=True)
+    for name, hist in commands_by_p95[:20]:
+        sql = metrics.sql[name]
+        embed.add_field(
+            name=f"/{name}",
+            value=f"{hist.count} calls • p50 {hist.quantile(0.5) * 1000:.0f} ms • p95 {hist.quantile(0.95) * 1000:.0f} ms • max {hist.max * 1000:.0f} ms\n"
+                  f"SQL per call: {sql.statements / hist.count:.1f} statements, {sql.seconds / hist.count * 1000:.1f} ms",
+            inline=False,
+        )
+
+    lag = metrics.loop_lag
+    rest = ', '.join(f"{endpoint}: {count}" for endpoint, count in sorted(metrics.rest_calls.items())) or 'none'
+    embed.add_field(name="__Event Loop Lag__", value=f"p95 {lag.quantile(0.95) * 1000:.0f} ms • max {lag.max * 1000:.0f} ms", inline=False)
+    batches = metrics.write_batch_size
+    if batches.count:
+        embed.add_field(name="__Group Commits__", value=f"{batches.count} commits • {batches.sum / batches.count:.1f} writes per commit on average • p95 {metrics.write_batch_seconds.quantile(0.95) * 1000:.0f} ms", inline=False)
+    embed.add_field(name="__REST Calls__", value=rest, inline=False)
+    users, memory = engine_memory()
+    embed.add_field(name="__Progress Engines__", value=f"{len(progress_engines)} server(s) • {users} users • {memory / 1024:.0f} KB of bitsets, {memory / max(users, 1):.0f} bytes per user", inline=False)
+    embed.add_field(name="__Caches__", value=f"read: {read_cache.hits} hits, {read_cache.misses} misses, {read_cache.coalesced} shared • render: {render_cache.hits} hits, {render_cache.misses} misses", inline=False)
+
+    if write_file:
+        path = os.getenv('METRICS_FILE', 'bot_metrics.prom')
+        await asyncio.to_thread(metrics.write_prometheus, path)
+        embed.set_footer(text=f"Written to {path}")
+    await ctx.response.send_message(embed=embed, ephemeral=True)
+
+@bot.application_command(name='adopt_legacy_data', help='Move challenges and progress recorded before per-server data into this server: !adopt_legacy_data')
+@discord.guild_only()
+@discord.commands.default_permissions(administrator=True) # only administrators can use this command
+async def adopt_legacy_data_command(ctx):
+    guild_id = guild_of(ctx)
+    moved = await db.transaction(adopt_legacy_data, guild_id)
+    if moved is None:
+        await ctx.response.send_message('This server already has its own challenges, so nothing was moved.')
+        return
+    challenges_changed(guild_id)
+    challenges_changed(LEGACY_GUILD)
+    challenge_indexes.pop(guild_id, None) # rebuilt on the next search
+    challenge_indexes.pop(LEGACY_GUILD, None)
+    progress_engines.pop(guild_id, None) # reloaded on next use
+    progress_engines.pop(LEGACY_GUILD, None)
+    await ctx.response.send_message(f'Moved {moved} challenge(s) and their progress into this server.')
 
 class AddChallengePaginator(ui.View): # subclass ui.View
 
@@ -446,10 +798,10 @@ class AddChallengePaginator(ui.View): # subclass ui.View
 
     async def start(self):
         if not self.data:
-            await self.ctx.response.send_message('No data to display.')
+            await self.ctx.respond('No data to display.')
             return
 
-        self.message = await self.ctx.response.send_message(embed=self.make_embed(), view=self) # send a message with the embed and the view
+        self.message = await self.ctx.respond(embed=self.make_embed(), view=self) # respond() also works after the interaction was deferred
         # remove the reaction code
 
     def make_embed(self):
@@ -458,8 +810,8 @@ class AddChallengePaginator(ui.View): # subclass ui.View
             color=discord.Color.blue(),
             description="",
         )
-        for i in range(self.current_page * 10, min((self.current_page + 1) * 10, len(self.data))):
-            embed.description += self.formatter(i, self.data[i])
+        start = self.current_page * 10
+        embed.description = ''.join(self.formatter(i, self.data[i]) for i in range(start, min(start + 10, len(self.data))))
 
         total_pages = (len(self.data) + 9) // 10
         embed.set_footer(text=f"Page {self.current_page + 1} of {total_pages}")
@@ -468,69 +820,6 @@ class AddChallengePaginator(ui.View): # subclass ui.View
 
 
 
-class ChallengePaginator(ui.View): # subclass ui.View
-
-    def __init__(self, ctx, challenges, title, formatter):
-        super().__init__() # call the super constructor
-        self.ctx = ctx
-        self.challenges = challenges
-        self.current_page = 0
-        self.title = title
-        self.formatter = formatter
-
-    @discord.ui.button(label="◀️ Previous Page", style=discord.ButtonStyle.primary) # create a button with label "Previous" and style primary
-    async def previous(self, button, interaction): # define a callback function for the button
-        if self.current_page > 0: # check if there is a previous page
-            self.current_page -= 1 # decrement the current page index
-            await interaction.response.edit_message(embed=self.make_embed()) # edit the message with the previous page
-
-    @discord.ui.button(label="Next Page ▶️", style=discord.ButtonStyle.primary) # create another button with label "Next" and style primary
-    async def next(self, button, interaction): # define another callback function for the button
-        if self.current_page < (len(self.challenges) - 1) // 10: # check if there is a next page
-            self.current_page += 1 # increment the current page index
-            await interaction.response.edit_message(embed=self.make_embed()) # edit the message with the next page
-
-    async def start(self):
-        if not self.challenges:
-            await self.ctx.response.send_message('No challenges exist yet.')
-            return
-
-        self.message = await self.ctx.response.send_message(embed=self.make_embed(), view=self) # send a message with the embed and the view
-        # remove the reaction code
-
-    def make_embed(self):
-        embed = discord.Embed(
-            title=self.title,
-            color=discord.Color.blue(),
-            description="",
-        )
-        for i in range(self.current_page * 10, min((self.current_page + 1) * 10, len(self.challenges))):
-            challenge_data = self.challenges[i]
-            embed.description += self.formatter(i, challenge_data) # type: ignore
-
-        total_pages = (len(self.challenges) + 9) // 10
-        embed.set_footer(text=f"Page {self.current_page + 1} of {total_pages}")
-
-        return embed
-    
-class Paginator:
-    def __init__(self, items, page_size=10):
-        self.items = items # the list of items to paginate
-        self.page_size = page_size # the number of items per page
-        self.max_pages = (len(items) - 1) // page_size + 1 # the total number of pages
-    
-    def get_page(self, page_number):
-        # return a sublist of items for the given page number
-        start_index = (page_number - 1) * self.page_size # the start index of the sublist
-        end_index = start_index + self.page_size # the end index of the sublist
-        return self.items[start_index:end_index] # return the sublist
-    
-    def get_max_pages(self):
-        # return the maximum number of pages
-        return self.max_pages
-
-
-
 class CompleteChallengePaginator(AddChallengePaginator):
     def __init__(self, ctx, data, title, formatter):
         super().__init__(ctx, data, title, formatter)
@@ -538,29 +827,42 @@ class CompleteChallengePaginator(AddChallengePaginator):
 
 
 @bot.application_command(name='remaining', aliases=['pendingChallenges'], help='Show the remaining challenges for a user: !remaining [user]')
+@discord.guild_only()
 async def remaining(ctx, user: discord.User = None): # type: ignore
     if user is None:
         user = ctx.author
-    conn = sqlite3.connect('challenges.db')
-    c = conn.cursor()
-    c.execute("""
-        SELECT challenge_name, points
-        FROM challenges
-        WHERE challenge_id NOT IN (
-            SELECT challenge_id FROM user_progress WHERE user_id = ? AND is_completed = ?
-        )
-        ORDER BY points DESC
-    """, (user.id, True))
-    results = c.fetchall()
-    conn.close()
-
-    def formatter(i, data):
-        challenge, points = data
-        emoji = '🏆' if points >= 100 else '🎖️' if points >= 50 else '🎗️'
-        return f'{i+1}. {emoji} **{challenge}** for `{points} points`\n'
-
-    paginator = ChallengePaginator(ctx, results, f'Remaining challenges for {user.name}', formatter)
-    await paginator.start()
-
-bot.run(TOKEN) # type: ignore
+    user_names.remember(user.id, user.name) # so the page renderer doesn't have to look the name up
+    await send_page(ctx, await remaining_page(ctx, 0, None, user.id), 'No challenges exist yet.')
+
+@paging.renderer('remaining')
+async def remaining_page(ctx, page, anchor, user_id):
+    guild_id = guild_of(ctx)
+    user_id = int(user_id)
+    name = await user_names.resolve_one(user_id, ctx.guild)
+    catalog = catalogs[guild_id]
+    cache_key = ('remaining', guild_id, user_id, name, catalog.version, catalog.progress_version(user_id))
+    engine = await loaded_engine(guild_id)
+    make_source = lambda: RemainingPageSource(engine, user_id)
+    return await render_challenge_list('remaining', user_id, page, anchor, f'Remaining challenges for {name}', emoji_formatter, cache_key, make_source)
+
+def use_database(database):
+    # Point the handlers at another Database (the benchmarks use this) and drop everything cached from the old one
+    global db
+    db = database
+    catalogs.clear()
+    challenge_indexes.clear()
+    progress_engines.clear()
+    render_cache.clear()
+    read_cache.clear()
+
+
+def main():
+    started = time.perf_counter()
+    applied = migrate_database(DB_PATH) # create, upgrade and check the schema before handling any commands
+    print(f'Schema checked in {time.perf_counter() - started:.2f}s ({applied} migration(s) applied)')
+    bot.run(TOKEN) # type: ignore
+
+
+if __name__ == '__main__':
+    main()
 
@@ -0,0 +1,48 @@
+class PerGuild(dict):
+    # {guild_id: factory(guild_id)}, with each value created the first time its guild is used
+
+    def __init__(self, factory):
+        super().__init__()
+        self.factory = factory
+
+    def __missing__(self, guild_id):
+        value = self[guild_id] = self.factory(guild_id)
+        return value
+
+
+class Catalog:
+    """Cached facts about one guild's challenge catalog, plus version counters.
+
+    Anything that adds or removes challenges must call changed() afterwards so the
+    next reader recomputes them, and anything that changes a user's progress must
+    call progress_changed() for that user. Render caches key their entries on these
+    versions.
+    """
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self._totals = None
+        self.version = 0
+        self._progress_versions = {} # user_id -> int
+
+    async def totals(self, db):
+        # Returns (number of challenges, total points)
+        if self._totals is not None:
+            return self._totals
+        version = self.version
+        count, points = await db.fetchone("SELECT COUNT(*), COALESCE(SUM(points), 0) FROM challenges WHERE guild_id = ?", (self.guild_id,))
+        if self.version == version: # if changed() ran during the query, the next caller reads again
+            self._totals = (count, points)
+        return count, points
+
+    def changed(self):
+        self._totals = None
+        self.version += 1
+
+    def progress_version(self, user_id):
+        return self._progress_versions.get(int(user_id), 0)
+
+    def progress_changed(self, user_ids):
+        for user_id in user_ids:
+            user_id = int(user_id)
+            self._progress_versions[user_id] = self._progress_versions.get(user_id, 0) + 1
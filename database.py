@@ -1,30 +1,183 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import queue
 import sqlite3
+import threading
+import time
 
-# Connect to the SQLite database
-conn = sqlite3.connect('challenges.db')
-
-# Create a cursor object
-c = conn.cursor()
-
-# Create table for challenges
-c.execute('''
-    CREATE TABLE challenges (
-        challenge_id INTEGER PRIMARY KEY,
-        challenge_name TEXT NOT NULL,
-        points INTEGER NOT NULL
-    )
-''')
-
-# Create table for users' progress
-c.execute('''
-    CREATE TABLE user_progress (
-        user_id TEXT NOT NULL,
-        challenge_id INTEGER NOT NULL,
-        is_completed BOOLEAN NOT NULL,
-        FOREIGN KEY(challenge_id) REFERENCES challenges(challenge_id)
-    )
-''')
-
-# Commit the changes and close the connection
-conn.commit()
-conn.close()
+from metrics import metrics
+
+DB_PATH = 'challenges.db'
+
+
+class Database:
+    """Awaitable access to the challenges database.
+
+    Queries run on a small pool of worker threads. Each thread keeps one
+    long-lived connection (in WAL mode, with its own prepared statement cache),
+    so handlers never block the event loop on SQLite.
+
+    Writes go through transaction(), which hands them to a single writer thread.
+    The writer takes every transaction queued within write_window seconds (up to
+    max_batch of them), runs each one in its own savepoint and commits them all
+    at once. A burst of /complete calls then costs one lock and one fsync instead
+    of one each, and writers never wait on each other's locks. Each caller still
+    gets its own result or exception.
+    """
+
+    def __init__(self, path=DB_PATH, pool_size=4, on_connect=None, write_window=0.002, max_batch=64):
+        self.path = path
+        self.pool_size = pool_size
+        self.on_connect = on_connect # called with each new connection, e.g. to install a trace callback
+        self.write_window = write_window
+        self.max_batch = max_batch
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='sqlite')
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._writes = queue.SimpleQueue() # (context, func, args, concurrent.futures.Future), or None to stop
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: we issue BEGIN/COMMIT ourselves in transaction()
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=256)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL') # readers; the writer thread switches to FULL
+            conn.execute('PRAGMA busy_timeout=5000')
+            conn.set_trace_callback(metrics.count_statement)
+            if self.on_connect is not None:
+                self.on_connect(conn)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _call(self, func, args):
+        start = time.perf_counter()
+        try:
+            return func(self._connection(), *args)
+        finally:
+            metrics.observe_sql(time.perf_counter() - start)
+
+    async def run(self, func, *args):
+        # Run func(conn, *args) on a worker thread and return its result.
+        # The caller's context goes along so the work is attributed to the right command.
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, self._call, func, args)
+        return await loop.run_in_executor(self._executor, call)
+
+    async def transaction(self, func, *args):
+        # Like run(), but func runs on the writer thread and its changes are committed before
+        # this returns. If func raises, only its own changes are rolled back.
+        self._start_writer()
+        future = concurrent.futures.Future()
+        self._writes.put((contextvars.copy_context(), func, args, future))
+        return await asyncio.wrap_future(future)
+
+    def _start_writer(self):
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name='sqlite-writer', daemon=True)
+                    self._writer.start()
+
+    def _next_batch(self):
+        # Block for the first write, then gather whatever else arrives within write_window
+        batch = [self._writes.get()]
+        deadline = time.perf_counter() + self.write_window
+        while batch[-1] is not None and len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._writes.get(timeout=remaining) if remaining > 0 else self._writes.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        conn = self._connection()
+        # FULL fsyncs the WAL on every COMMIT (NORMAL only does so at checkpoints), so a
+        # committed batch survives a power loss; group commit spreads that fsync over the batch
+        conn.execute('PRAGMA synchronous=FULL')
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is None
+            jobs = [job for job in batch if job is not None]
+            if jobs:
+                self._commit_batch(conn, jobs)
+            if stop:
+                return
+
+    def _commit_batch(self, conn, jobs):
+        start = time.perf_counter()
+        done = [] # (future, result) for jobs whose changes are part of this commit
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for context, func, args, future in jobs:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT write')
+                try:
+                    result = context.run(self._call, func, args)
+                except BaseException as error:
+                    conn.execute('ROLLBACK TO write')
+                    conn.execute('RELEASE write')
+                    future.set_exception(error)
+                    continue
+                conn.execute('RELEASE write')
+                done.append((future, result))
+            conn.execute('COMMIT')
+        except BaseException as error:
+            # BEGIN or COMMIT itself failed, so nothing in the batch was written
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for _, _, _, future in jobs:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        # Results are only handed out once they are durable (the COMMIT above was fsynced)
+        for future, result in done:
+            future.set_result(result)
+        metrics.observe_write_batch(len(jobs), time.perf_counter() - start)
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchval(self, sql, params=()):
+        row = await self.fetchone(sql, params)
+        return row[0] if row is not None else None
+
+    def close(self):
+        if self._writer is not None:
+            self._writes.put(None) # the writer finishes what is already queued, then exits
+            self._writer.join()
+            self._writer = None
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+# Shared instance used by the bot's command handlers
+db = Database()
+
+
+def normalize_name(name):
+    # Key used for case-insensitive challenge lookups (challenges.name_key)
+    return name.strip().lower()
+
+
+if __name__ == '__main__':
+    from migrations import migrate_database
+
+    # Create the tables, or upgrade an existing database to the latest schema
+    applied = migrate_database(DB_PATH)
+    print(f'Applied {applied} migration(s) to {DB_PATH}')
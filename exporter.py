@@ -0,0 +1,74 @@
+import csv
+import gzip
+import json
+from datetime import datetime, timezone
+
+# Exports a guild's progress or standings as a gzip-compressed CSV or JSON Lines file.
+# Rows go from the cursor straight into the compressor one at a time, so memory use
+# stays flat however large the tables are. Meant to run on a database thread.
+
+EXPORTS = ('progress', 'leaderboard')
+FORMATS = ('csv', 'jsonl')
+
+
+def _progress(conn, guild_id):
+    # This order comes straight from an index, so SQLite streams the rows instead of sorting them first
+    rows = conn.execute("""
+        SELECT user_progress.user_id, challenges.challenge_name, challenges.points, user_progress.completed_at
+        FROM user_progress
+        INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
+        WHERE user_progress.guild_id = ? AND user_progress.is_completed = 1
+        ORDER BY user_progress.user_id, user_progress.challenge_id
+    """, (guild_id,))
+    for user_id, challenge_name, points, completed_at in rows:
+        if completed_at is not None:
+            completed_at = datetime.fromtimestamp(completed_at, timezone.utc).isoformat()
+        yield {'user_id': user_id, 'challenge_name': challenge_name, 'points': points, 'completed_at': completed_at}
+
+
+def _leaderboard(conn, guild_id):
+    # Ranks match /leaderboard: users with equal points share a rank
+    rows = conn.execute("""
+        SELECT user_id, points, completed
+        FROM user_scores
+        WHERE guild_id = ? AND completed > 0
+        ORDER BY points DESC, user_id
+    """, (guild_id,))
+    rank, previous_points = 0, None
+    for position, (user_id, points, completed) in enumerate(rows, start=1):
+        if points != previous_points:
+            rank, previous_points = position, points
+        yield {'rank': rank, 'user_id': user_id, 'points': points, 'completed': completed}
+
+
+COLUMNS = {
+    'progress': ('user_id', 'challenge_name', 'points', 'completed_at'),
+    'leaderboard': ('rank', 'user_id', 'points', 'completed'),
+}
+
+
+def export(conn, guild_id, what, file_format, path, name_of=None):
+    """Write a guild's 'progress' or 'leaderboard' to path as gzipped 'csv' or 'jsonl'.
+
+    If name_of is given, it is called with each user id and a username column is added
+    (None/empty when it returns None). Returns the number of rows written.
+    """
+    rows = _progress(conn, guild_id) if what == 'progress' else _leaderboard(conn, guild_id)
+    columns = list(COLUMNS[what])
+    if name_of is not None:
+        columns.insert(columns.index('user_id') + 1, 'username')
+
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as out:
+        if file_format == 'csv':
+            writer = csv.DictWriter(out, columns)
+            writer.writeheader()
+        for row in rows:
+            if name_of is not None:
+                row['username'] = name_of(row['user_id'])
+            if file_format == 'csv':
+                writer.writerow(row)
+            else:
+                out.write(json.dumps({column: row[column] for column in columns}, ensure_ascii=False) + '\n')
+            count += 1
+    return count
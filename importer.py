@@ -0,0 +1,121 @@
+import csv
+import io
+import json
+
+from database import normalize_name
+
+NAME_COLUMNS = ('challenge_name', 'challenge', 'name')
+
+
+def parse_challenges(data, filename):
+    """Yield (challenge_name, points) pairs from an uploaded CSV or JSON file.
+
+    CSV files need a name and a points column, with or without a header row.
+    JSON files can be JSON Lines (one object or [name, points] pair per line), which
+    is parsed a line at a time, or a single array of the same items.
+    Points are returned as given; import_challenges() validates them.
+    """
+    text = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline='')
+    if filename.lower().endswith('.csv'):
+        try:
+            yield from _parse_csv(text)
+        except csv.Error as error:
+            raise ValueError(error) from error
+        return
+
+    first = text.read(1)
+    while first.isspace():
+        first = text.read(1)
+    if first == '[':
+        # A single JSON array has to be decoded in one go
+        for item in json.loads(first + text.read()):
+            yield _json_item(item)
+        return
+    # JSON Lines
+    for line in _prepend(first, text):
+        if line.strip():
+            yield _json_item(json.loads(line))
+
+
+def _prepend(first, text):
+    # Put back the character we peeked at before iterating lines
+    lines = iter(text)
+    yield first + next(lines, '')
+    yield from lines
+
+
+def _parse_csv(text):
+    reader = csv.reader(text)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [column.strip().lower() for column in header]
+    name_column = next((columns.index(name) for name in NAME_COLUMNS if name in columns), None)
+    if name_column is not None and 'points' in columns:
+        points_column = columns.index('points')
+    else:
+        # No header row: the first line is data in "name, points" order
+        name_column, points_column = 0, 1
+        if len(header) >= 2:
+            yield header[0], header[1]
+    for row in reader:
+        if len(row) > max(name_column, points_column):
+            yield row[name_column], row[points_column]
+        elif row:
+            yield row[0], None
+
+
+def _json_item(item):
+    if isinstance(item, dict):
+        name = next((item[column] for column in NAME_COLUMNS if column in item), None)
+        return name, item.get('points')
+    if isinstance(item, (list, tuple)) and len(item) == 2:
+        return item[0], item[1]
+    return None, None
+
+
+def import_challenges(conn, guild_id, rows, batch_size=500):
+    """Insert parsed (challenge_name, points) rows into a guild, skipping names that already exist there.
+
+    Meant to run inside a transaction. Rows are consumed in batches: each batch is
+    checked against the name_key index with one query and inserted with one
+    executemany. Returns [(challenge_name, points, status)].
+    """
+    results = [] # in file order; a batched row's entry is filled in when its batch is flushed
+    seen = set()
+    batch = [] # (index in results, name_key, challenge_name, points)
+
+    def flush():
+        keys = json.dumps([key for _, key, _, _ in batch])
+        existing = {row[0] for row in conn.execute("SELECT name_key FROM challenges WHERE guild_id = ? AND name_key IN (SELECT value FROM json_each(?))", (guild_id, keys))}
+        new_rows = []
+        for index, key, name, points in batch:
+            if key in existing:
+                results[index] = (name, points, 'already exists')
+            else:
+                new_rows.append((guild_id, name, key, points))
+                results[index] = (name, points, 'added')
+        conn.executemany("INSERT INTO challenges (guild_id, challenge_name, name_key, points) VALUES (?, ?, ?, ?)", new_rows)
+        batch.clear()
+
+    for name, points in rows:
+        name = str(name).strip().strip('"') if name is not None else ''
+        if not name:
+            continue
+        try:
+            points = int(points)
+        except (TypeError, ValueError):
+            results.append((name, points, 'invalid points'))
+            continue
+        key = normalize_name(name)
+        if key in seen:
+            results.append((name, points, 'duplicate in file'))
+            continue
+        seen.add(key)
+        batch.append((len(results), key, name, points))
+        results.append(None)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return results
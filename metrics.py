@@ -0,0 +1,167 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+
+# Process-wide counters for finding hot paths: command latency, SQL work per command,
+# Discord REST calls and event loop lag. Everything lives in the shared `metrics` instance.
+
+# Name of the command being handled; copied into database threads so SQL is attributed to it
+current_command = contextvars.ContextVar('current_command', default='(none)')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class Histogram:
+    # Cumulative-bucket histogram, the same shape Prometheus uses
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation (max for the +Inf bucket)
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class SqlStats:
+    def __init__(self):
+        self.calls = 0 # round trips to a database thread
+        self.statements = 0
+        self.seconds = 0.0
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock() # SQL stats are updated from database threads
+        self.started_at = time.time()
+        self.commands = defaultdict(Histogram)
+        self.sql = defaultdict(SqlStats)
+        self.rest_calls = defaultdict(int)
+        self.loop_lag = Histogram()
+        self.write_batch_size = Histogram(BATCH_BUCKETS) # transactions per group commit
+        self.write_batch_seconds = Histogram()
+        self.caches = {} # name -> object with hits/misses (and optionally coalesced) counters
+
+    def observe_command(self, name, seconds):
+        self.commands[name].observe(seconds)
+
+    def observe_sql(self, seconds):
+        with self._lock:
+            stats = self.sql[current_command.get()]
+            stats.calls += 1
+            stats.seconds += seconds
+
+    def count_statement(self, statement=None):
+        # Installed as the sqlite3 trace callback on every connection
+        with self._lock:
+            self.sql[current_command.get()].statements += 1
+
+    def observe_write_batch(self, size, seconds):
+        # Called from the database writer thread after each group commit
+        with self._lock:
+            self.write_batch_size.observe(size)
+            self.write_batch_seconds.observe(seconds)
+
+    def register_cache(self, name, cache):
+        self.caches[name] = cache
+
+    def count_rest_call(self, endpoint):
+        self.rest_calls[endpoint] += 1
+
+    async def monitor_loop_lag(self, interval=0.5):
+        # Sleep for `interval` over and over; any extra delay is time the event loop was blocked
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag.observe(max(0.0, loop.time() - start - interval))
+
+    async def write_periodically(self, path, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.write_prometheus, path)
+
+    def prometheus_text(self):
+        lines = []
+
+        def histogram(name, help_text, label, histograms):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, hist in histograms:
+                labels = f'{label}="{key}",' if label else ''
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {hist.count}')
+                suffix = f'{{{labels.rstrip(",")}}}' if labels else ''
+                lines.append(f'{name}_sum{suffix} {hist.sum}')
+                lines.append(f'{name}_count{suffix} {hist.count}')
+
+        histogram('bot_command_duration_seconds', 'Time spent handling each command.', 'command', sorted(self.commands.items()))
+
+        with self._lock:
+            sql = sorted((name, stats.calls, stats.statements, stats.seconds) for name, stats in self.sql.items())
+        for metric, help_text, column in (
+            ('bot_sql_calls_total', 'Database round trips, by command.', 1),
+            ('bot_sql_statements_total', 'SQL statements executed, by command.', 2),
+            ('bot_sql_seconds_total', 'Time spent in the database, by command.', 3),
+        ):
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for row in sql:
+                lines.append(f'{metric}{{command="{row[0]}"}} {row[column]}')
+
+        lines.append('# HELP bot_rest_calls_total Discord REST calls made by the bot, by endpoint.')
+        lines.append('# TYPE bot_rest_calls_total counter')
+        for endpoint, count in sorted(self.rest_calls.items()):
+            lines.append(f'bot_rest_calls_total{{endpoint="{endpoint}"}} {count}')
+
+        lines.append('# HELP bot_cache_requests_total Cache lookups, by cache and result.')
+        lines.append('# TYPE bot_cache_requests_total counter')
+        for name, cache in sorted(self.caches.items()):
+            for result in ('hits', 'misses', 'coalesced'):
+                if hasattr(cache, result):
+                    lines.append(f'bot_cache_requests_total{{cache="{name}",result="{result}"}} {getattr(cache, result)}')
+
+        histogram('bot_write_batch_size', 'Transactions committed together by the database writer.', None, [(None, self.write_batch_size)])
+        histogram('bot_write_batch_seconds', 'Time the database writer spent on each group commit.', None, [(None, self.write_batch_seconds)])
+
+        histogram('bot_event_loop_lag_seconds', 'How late the event loop woke up from a sleep.', None, [(None, self.loop_lag)])
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        # Write to a temporary file and rename it, so a scraper never reads half a file
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+metrics = Metrics()
@@ -0,0 +1,271 @@
+import os
+import sqlite3
+
+import scores
+from database import normalize_name
+
+# Schema migrations, applied in order. PRAGMA user_version records how many
+# have run, so an existing challenges.db is upgraded in place.
+
+LEGACY_GUILD = -1 # holds data from before guild partitions; no server or DM ever has this id
+
+
+def initial_schema(conn):
+    # The tables as database.py originally created them
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS challenges (
+            challenge_id INTEGER PRIMARY KEY,
+            challenge_name TEXT NOT NULL,
+            points INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_progress (
+            user_id TEXT NOT NULL,
+            challenge_id INTEGER NOT NULL,
+            is_completed BOOLEAN NOT NULL,
+            FOREIGN KEY(challenge_id) REFERENCES challenges(challenge_id)
+        )
+    ''')
+
+
+def constraints_and_indexes(conn):
+    # Rebuild challenges with a normalized name column so lookups can use an index
+    conn.execute('''
+        CREATE TABLE challenges_new (
+            challenge_id INTEGER PRIMARY KEY,
+            challenge_name TEXT NOT NULL,
+            name_key TEXT NOT NULL,
+            points INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO challenges_new (challenge_id, challenge_name, name_key, points)
+        SELECT challenge_id, challenge_name, normalize_name(challenge_name), points FROM challenges
+    ''')
+
+    # Merge challenges whose names only differ by case, keeping the oldest one
+    conn.execute('''
+        CREATE TEMP TABLE duplicate_challenges AS
+        SELECT c.challenge_id AS old_id, keep.keep_id AS new_id
+        FROM challenges_new c
+        INNER JOIN (SELECT name_key, MIN(challenge_id) AS keep_id FROM challenges_new GROUP BY name_key) keep
+            ON c.name_key = keep.name_key
+        WHERE c.challenge_id != keep.keep_id
+    ''')
+    conn.execute('''
+        UPDATE user_progress
+        SET challenge_id = (SELECT new_id FROM duplicate_challenges WHERE old_id = user_progress.challenge_id)
+        WHERE challenge_id IN (SELECT old_id FROM duplicate_challenges)
+    ''')
+    conn.execute("DELETE FROM challenges_new WHERE challenge_id IN (SELECT old_id FROM duplicate_challenges)")
+    conn.execute("DROP TABLE duplicate_challenges")
+
+    conn.execute("DROP TABLE challenges")
+    conn.execute("ALTER TABLE challenges_new RENAME TO challenges")
+    conn.execute("CREATE UNIQUE INDEX idx_challenges_name_key ON challenges (name_key)")
+
+    # Collapse duplicate progress rows; a challenge counts as completed if any copy was
+    conn.execute('''
+        CREATE TABLE user_progress_new (
+            user_id TEXT NOT NULL,
+            challenge_id INTEGER NOT NULL,
+            is_completed BOOLEAN NOT NULL,
+            UNIQUE(user_id, challenge_id),
+            FOREIGN KEY(challenge_id) REFERENCES challenges(challenge_id)
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO user_progress_new (user_id, challenge_id, is_completed)
+        SELECT user_id, challenge_id, MAX(is_completed) FROM user_progress GROUP BY user_id, challenge_id
+    ''')
+    conn.execute("DROP TABLE user_progress")
+    conn.execute("ALTER TABLE user_progress_new RENAME TO user_progress")
+    conn.execute("CREATE INDEX idx_user_progress_user ON user_progress (user_id, is_completed, challenge_id)")
+
+
+def user_scores(conn):
+    # Per-user totals kept up to date by complete/delete_challenge, so the leaderboard is an index read
+    conn.execute('''
+        CREATE TABLE user_scores (
+            user_id TEXT PRIMARY KEY,
+            points INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_user_scores_rank ON user_scores (points DESC, user_id)")
+    # Progress rows for challenges deleted before this migration no longer count towards anything
+    conn.execute("DELETE FROM user_progress WHERE challenge_id NOT IN (SELECT challenge_id FROM challenges)")
+    conn.execute('''
+        INSERT INTO user_scores (user_id, points, completed)
+        SELECT user_progress.user_id, SUM(challenges.points), COUNT(*)
+        FROM user_progress
+        INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
+        WHERE user_progress.is_completed = 1
+        GROUP BY user_progress.user_id
+    ''')
+
+
+def points_order_index(conn):
+    # Keyset pagination over challenges walks this index in (points DESC, challenge_id) order
+    conn.execute("CREATE INDEX idx_challenges_points ON challenges (points DESC, challenge_id)")
+
+
+def completion_times(conn):
+    # Unix time a challenge was completed; NULL for completions recorded before this column existed
+    conn.execute("ALTER TABLE user_progress ADD COLUMN completed_at INTEGER")
+
+
+def guild_partitions(conn):
+    # Partition challenges, progress and scores by guild, with guild-leading indexes.
+    # Existing data goes to LEGACY_GUILD_ID if it is set, otherwise to LEGACY_GUILD, which a
+    # server can take over later with /adopt_legacy_data.
+    legacy_guild = int(os.getenv('LEGACY_GUILD_ID') or LEGACY_GUILD)
+
+    conn.execute("ALTER TABLE challenges ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0")
+    conn.execute("UPDATE challenges SET guild_id = ?", (legacy_guild,))
+    conn.execute("DROP INDEX idx_challenges_name_key")
+    conn.execute("DROP INDEX idx_challenges_points")
+    conn.execute("CREATE UNIQUE INDEX idx_challenges_guild_name_key ON challenges (guild_id, name_key)")
+    conn.execute("CREATE INDEX idx_challenges_guild_points ON challenges (guild_id, points DESC, challenge_id)")
+    conn.execute("CREATE INDEX idx_challenges_guild_id ON challenges (guild_id, challenge_id)")
+
+    conn.execute("ALTER TABLE user_progress ADD COLUMN guild_id INTEGER NOT NULL DEFAULT 0")
+    conn.execute("UPDATE user_progress SET guild_id = ?", (legacy_guild,))
+    conn.execute("DROP INDEX idx_user_progress_user")
+    conn.execute("CREATE INDEX idx_user_progress_guild_user ON user_progress (guild_id, user_id, is_completed, challenge_id)")
+
+    conn.execute('''
+        CREATE TABLE user_scores_new (
+            guild_id INTEGER NOT NULL,
+            user_id TEXT NOT NULL,
+            points INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        )
+    ''')
+    conn.execute("INSERT INTO user_scores_new (guild_id, user_id, points, completed) SELECT ?, user_id, points, completed FROM user_scores", (legacy_guild,))
+    conn.execute("DROP TABLE user_scores")
+    conn.execute("ALTER TABLE user_scores_new RENAME TO user_scores")
+    conn.execute("CREATE INDEX idx_user_scores_guild_rank ON user_scores (guild_id, points DESC, user_id)")
+
+
+def score_rollups(conn):
+    # Per-day, per-week and per-season totals for time-windowed leaderboards (see scores.py),
+    # filled in from the completion times recorded so far
+    conn.execute('''
+        CREATE TABLE score_rollups (
+            guild_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            period_start INTEGER NOT NULL,
+            user_id TEXT NOT NULL,
+            points INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, period, period_start, user_id)
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_score_rollups_rank ON score_rollups (guild_id, period, period_start, points DESC, user_id)")
+    for (guild_id,) in conn.execute("SELECT DISTINCT guild_id FROM user_progress").fetchall():
+        scores.rebuild_rollups(conn, guild_id)
+
+
+def legacy_placeholder(conn):
+    # Legacy data used to sit under guild 0, which is also what direct messages mapped to.
+    # Move it (and anything recorded from DMs) to LEGACY_GUILD, which nothing can reach.
+    for table in ('challenges', 'user_progress', 'user_scores', 'score_rollups'):
+        conn.execute(f"UPDATE {table} SET guild_id = ? WHERE guild_id = 0", (LEGACY_GUILD,))
+
+
+def progress_by_challenge(conn):
+    # Deleting a challenge finds its completions by challenge_id alone; the other user_progress
+    # indexes lead with guild_id or user_id, so without this every delete scans the whole table
+    conn.execute("CREATE INDEX idx_user_progress_challenge ON user_progress (challenge_id, is_completed)")
+
+
+MIGRATIONS = [
+    initial_schema,
+    constraints_and_indexes,
+    user_scores,
+    points_order_index,
+    completion_times,
+    guild_partitions,
+    score_rollups,
+    legacy_placeholder,
+    progress_by_challenge,
+]
+
+
+# What the tables, columns and indexes look like after the last migration
+SCHEMA = {
+    'challenges': {'challenge_id', 'challenge_name', 'name_key', 'points', 'guild_id'},
+    'user_progress': {'user_id', 'challenge_id', 'is_completed', 'completed_at', 'guild_id'},
+    'user_scores': {'guild_id', 'user_id', 'points', 'completed'},
+    'score_rollups': {'guild_id', 'period', 'period_start', 'user_id', 'points', 'completed'},
+}
+INDEXES = {
+    'idx_challenges_guild_name_key', 'idx_challenges_guild_points', 'idx_challenges_guild_id',
+    'idx_user_progress_guild_user', 'idx_user_progress_challenge', 'idx_user_scores_guild_rank', 'idx_score_rollups_rank',
+}
+
+
+def schema_problems(conn):
+    # Differences between the database and the latest schema, as readable strings; empty if it matches
+    problems = []
+    for table, columns in SCHEMA.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if not existing:
+            problems.append(f'table {table} is missing')
+        elif columns - existing:
+            problems.append(f"table {table} is missing column(s) {', '.join(sorted(columns - existing))}")
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    problems.extend(f'index {index} is missing' for index in sorted(INDEXES - existing))
+    return problems
+
+
+def adopt_legacy_data(conn, guild_id):
+    # Move everything stored under LEGACY_GUILD (data from before guild partitions) into guild_id.
+    # Returns the number of challenges moved, or None if the guild already has challenges.
+    if conn.execute("SELECT 1 FROM challenges WHERE guild_id = ? LIMIT 1", (guild_id,)).fetchone():
+        return None
+    moved = conn.execute("UPDATE challenges SET guild_id = ? WHERE guild_id = ?", (guild_id, LEGACY_GUILD)).rowcount
+    conn.execute("UPDATE user_progress SET guild_id = ? WHERE guild_id = ?", (guild_id, LEGACY_GUILD))
+    conn.execute("DELETE FROM user_scores WHERE guild_id = ?", (guild_id,))
+    conn.execute("UPDATE user_scores SET guild_id = ? WHERE guild_id = ?", (guild_id, LEGACY_GUILD))
+    conn.execute("DELETE FROM score_rollups WHERE guild_id = ?", (guild_id,))
+    conn.execute("UPDATE score_rollups SET guild_id = ? WHERE guild_id = ?", (guild_id, LEGACY_GUILD))
+    return moved
+
+
+def migrate(conn):
+    # Apply every migration newer than the database's user_version.
+    # conn must be in autocommit mode (isolation_level=None); each step gets its own transaction.
+    conn.create_function('normalize_name', 1, normalize_name, deterministic=True)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0 and not schema_problems(conn):
+        # The tables are already up to date but the version was lost (e.g. a database
+        # restored from an SQL dump), so record it instead of creating them again
+        conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+        return 0
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    return max(len(MIGRATIONS) - version, 0)
+
+
+def migrate_database(path):
+    # Bring the database at path up to date and check the result; safe to run on every start
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        applied = migrate(conn)
+        problems = schema_problems(conn)
+        if problems:
+            raise RuntimeError(f"{path} doesn't match the expected schema: {'; '.join(problems)}")
+        return applied
+    finally:
+        conn.close()
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import discord
+
+from metrics import metrics
+
+
+class UserNameResolver:
+    """Turns user ids into display names with as few REST calls as possible.
+
+    Lookups go to the guild member cache first, then the client's user cache,
+    then a TTL/LRU cache of earlier results. Whatever is left is fetched from
+    the API concurrently, at most `concurrency` requests at a time.
+    """
+
+    def __init__(self, client, max_size=5000, ttl=3600, concurrency=5):
+        self.client = client
+        self.max_size = max_size
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self._cache = OrderedDict() # user_id -> (name, expires_at), oldest first
+        self._semaphore = None
+
+    def _get_cached(self, user_id):
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return None
+        name, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._cache[user_id]
+            return None
+        self._cache.move_to_end(user_id)
+        return name
+
+    def remember(self, user_id, name):
+        self._cache[user_id] = (name, time.monotonic() + self.ttl)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _from_local_caches(self, user_id, guild):
+        member = guild.get_member(user_id) if guild is not None else None
+        if member is not None:
+            return member.name
+        user = self.client.get_user(user_id)
+        if user is not None:
+            return user.name
+        return self._get_cached(user_id)
+
+    def peek(self, user_id, guild=None):
+        # A name from the local caches, or None. Never calls the API and never reorders
+        # the cache, so it is safe to call from a database thread (e.g. during /export).
+        member = guild.get_member(user_id) if guild is not None else None
+        if member is not None:
+            return member.name
+        user = self.client.get_user(user_id)
+        if user is not None:
+            return user.name
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[1] >= time.monotonic():
+            return entry[0]
+        return None
+
+    async def _fetch(self, user_id):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            metrics.count_rest_call('fetch_user')
+            try:
+                user = await self.client.fetch_user(user_id)
+            except discord.NotFound:
+                return f'Unknown user ({user_id})'
+            except discord.HTTPException:
+                return str(user_id) # don't cache transient failures
+        self.remember(user_id, user.name)
+        return user.name
+
+    async def resolve(self, user_ids, guild=None):
+        # Returns {user_id: name} for the given ids (ids may be ints or numeric strings)
+        names = {}
+        misses = []
+        for user_id in user_ids:
+            name = self._from_local_caches(int(user_id), guild)
+            if name is None:
+                misses.append(user_id)
+            else:
+                names[user_id] = name
+
+        fetched = await asyncio.gather(*(self._fetch(int(user_id)) for user_id in misses))
+        names.update(zip(misses, fetched))
+        return names
+
+    async def resolve_one(self, user_id, guild=None):
+        return (await self.resolve([user_id], guild))[user_id]
@@ -0,0 +1,175 @@
+# Page sources for challenge lists. A page source hands out one page of
+# (challenge_name, points) rows at a time, so rendering a page only reads that page.
+
+import asyncio
+
+
+class ListPageSource:
+    # Pages over a list that is already in memory (e.g. search results)
+
+    def __init__(self, items, page_size=10):
+        self.items = items
+        self.page_size = page_size
+
+    async def count(self):
+        return len(self.items)
+
+    async def get_page(self, page_number, anchor=None):
+        start = page_number * self.page_size
+        return self.items[start:start + self.page_size]
+
+    def page_keys(self):
+        return None, None
+
+
+class SearchPageSource(ListPageSource):
+    # Fuzzy search results from a SearchIndex. The search runs on a worker thread the
+    # first time the results are needed, so scoring never blocks the event loop.
+
+    def __init__(self, index, keyword, limit=20, min_score=50, page_size=10):
+        super().__init__(None, page_size)
+        self.index = index
+        self.keyword = keyword
+        self.limit = limit
+        self.min_score = min_score
+
+    async def _results(self):
+        if self.items is None:
+            self.items = await asyncio.to_thread(self.index.search, self.keyword, self.limit, self.min_score)
+        return self.items
+
+    async def count(self):
+        return len(await self._results())
+
+    async def get_page(self, page_number, anchor=None):
+        await self._results()
+        return await super().get_page(page_number, anchor)
+
+
+class ChallengePageSource:
+    """Pages through the challenges table ordered by points (highest first).
+
+    Moving one page forward or back is a keyset query from the first or last row of
+    the current page: two seeks on the (guild_id, points DESC, challenge_id) index, so
+    it costs the same on page 1 and page 1000. Only the current page's rows and the
+    total count are kept. Only the guild's challenges are listed.
+
+    page_keys() gives the (points, challenge_id) of the current page's first and last
+    rows. Passing one back as get_page's anchor lets a later, fresh source (e.g. one
+    built for a button press) take the keyset path too.
+    """
+
+    def __init__(self, db, guild_id, page_size=10):
+        self.db = db
+        self.guild_id = guild_id
+        self.page_size = page_size
+        self._count = None
+        self._page_number = None
+        self._rows = [] # (challenge_id, challenge_name, points) for the current page
+
+    def _filter(self):
+        return "guild_id = ?", (self.guild_id,)
+
+    async def count(self):
+        if self._count is None:
+            where, params = self._filter()
+            self._count = await self.db.fetchval(f"SELECT COUNT(*) FROM challenges WHERE {where}", params)
+        return self._count
+
+    async def get_page(self, page_number, anchor=None):
+        # anchor is ('after', points, challenge_id) for the row just before the page, or
+        # ('before', points, challenge_id) for the row just after it
+        where, params = self._filter()
+        if anchor is None and self._rows and page_number == self._page_number + 1:
+            anchor = ('after', *self._key(self._rows[-1]))
+        elif anchor is None and self._rows and page_number == self._page_number - 1:
+            anchor = ('before', *self._key(self._rows[0]))
+
+        if page_number == self._page_number:
+            rows = self._rows
+        elif anchor is not None and anchor[0] == 'after':
+            # Two index seeks: the rest of the anchor's points group, then the lower points.
+            # A single (points < ? OR (points = ? AND ...)) can't seek, so it would walk
+            # from the top of the list (or of a large group of equal points) every time.
+            _, points, challenge_id = anchor
+            rows = await self.db.fetchall(f"""
+                SELECT * FROM (
+                    SELECT challenge_id, challenge_name, points FROM challenges
+                    WHERE {where} AND points = ? AND challenge_id > ?
+                    ORDER BY challenge_id
+                    LIMIT ?
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT challenge_id, challenge_name, points FROM challenges
+                    WHERE {where} AND points < ?
+                    ORDER BY points DESC, challenge_id
+                    LIMIT ?
+                )
+                ORDER BY points DESC, challenge_id
+                LIMIT ?
+            """, (*params, points, challenge_id, self.page_size, *params, points, self.page_size, self.page_size))
+        elif anchor is not None:
+            _, points, challenge_id = anchor
+            rows = await self.db.fetchall(f"""
+                SELECT * FROM (
+                    SELECT challenge_id, challenge_name, points FROM challenges
+                    WHERE {where} AND points = ? AND challenge_id < ?
+                    ORDER BY challenge_id DESC
+                    LIMIT ?
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT challenge_id, challenge_name, points FROM challenges
+                    WHERE {where} AND points > ?
+                    ORDER BY points ASC, challenge_id DESC
+                    LIMIT ?
+                )
+                ORDER BY points ASC, challenge_id DESC
+                LIMIT ?
+            """, (*params, points, challenge_id, self.page_size, *params, points, self.page_size, self.page_size))
+            rows.reverse()
+        else:
+            # Jumping to an arbitrary page falls back to OFFSET
+            rows = await self.db.fetchall(f"""
+                SELECT challenge_id, challenge_name, points FROM challenges
+                WHERE {where}
+                ORDER BY points DESC, challenge_id
+                LIMIT ? OFFSET ?
+            """, (*params, self.page_size, page_number * self.page_size))
+        self._page_number = page_number
+        self._rows = rows
+        return [(challenge_name, points) for _, challenge_name, points in rows]
+
+    def page_keys(self):
+        if not self._rows:
+            return None, None
+        return self._key(self._rows[0]), self._key(self._rows[-1])
+
+    @staticmethod
+    def _key(row):
+        challenge_id, _, points = row
+        return points, challenge_id
+
+
+class RemainingPageSource:
+    # A user's remaining challenges from a ProgressEngine: same order, pages and anchors as
+    # ChallengePageSource, without touching the database
+
+    def __init__(self, engine, user_id, page_size=10):
+        self.engine = engine
+        self.user_id = user_id
+        self.page_size = page_size
+        self._rows = [] # (challenge_id, challenge_name, points) for the current page
+
+    async def count(self):
+        return self.engine.remaining_count(self.user_id)
+
+    async def get_page(self, page_number, anchor=None):
+        self._rows = self.engine.remaining_page(self.user_id, page_number, self.page_size, anchor)
+        return [(challenge_name, points) for _, challenge_name, points in self._rows]
+
+    def page_keys(self):
+        if not self._rows:
+            return None, None
+        return ChallengePageSource._key(self._rows[0]), ChallengePageSource._key(self._rows[-1])
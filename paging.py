@@ -0,0 +1,95 @@
+import discord
+from discord import ui
+
+# Stateless page buttons. Everything needed to draw the page a button leads to is
+# encoded in its custom_id as "page:<kind>:<page>:<anchor>[:<arg>]", so no view,
+# task or list is kept per message and the buttons keep working after a restart.
+# Each kind has a renderer, registered with @renderer(kind):
+#
+#     async def render(ctx, page, anchor, *args) -> (embed, view)
+#
+# ctx is the command context for the first page and the button's Interaction after
+# that; both have guild_id, guild and user. The anchor is the keyset position from
+# ChallengePageSource.page_keys() (or None) and arg is a single string that may
+# contain ':'. handle() routes a button press to its renderer.
+
+PREFIX = 'page'
+MAX_CUSTOM_ID = 100 # Discord's limit
+
+renderers = {} # kind -> render coroutine function
+
+
+def renderer(kind):
+    def register(func):
+        renderers[kind] = func
+        return func
+    return register
+
+
+def encode_anchor(direction, key):
+    # key is (points, challenge_id); 'a' = the page starts after it, 'b' = it ends before it
+    if key is None:
+        return ''
+    points, challenge_id = key
+    return f'{direction}{points}_{challenge_id}'
+
+
+def decode_anchor(text):
+    if not text:
+        return None
+    points, challenge_id = text[1:].split('_')
+    return ('after' if text[0] == 'a' else 'before', int(points), int(challenge_id))
+
+
+def custom_id(kind, page, anchor='', arg=None):
+    parts = [PREFIX, kind, str(page), anchor]
+    if arg is not None:
+        parts.append(str(arg))
+    return ':'.join(parts)
+
+
+def parse_custom_id(value):
+    # Returns (kind, page, anchor, args), or None if value isn't a page button's custom_id
+    parts = (value or '').split(':', 4)
+    if len(parts) < 4 or parts[0] != PREFIX or parts[1] not in renderers:
+        return None
+    try:
+        return parts[1], int(parts[2]), decode_anchor(parts[3]), tuple(parts[4:])
+    except ValueError:
+        return None
+
+
+def buttons(kind, page, total_pages, arg=None, page_keys=(None, None)):
+    """Previous/next buttons for page (0-based) of total_pages, or None if there is only one page.
+
+    page_keys are the current page's first and last keyset positions, if the source has them.
+    """
+    if total_pages <= 1:
+        return None
+    first_key, last_key = page_keys
+    previous_id = custom_id(kind, page - 1, encode_anchor('b', first_key), arg)
+    next_id = custom_id(kind, page + 1, encode_anchor('a', last_key), arg)
+    if max(len(previous_id), len(next_id)) > MAX_CUSTOM_ID:
+        return None
+    view = ui.View(timeout=None, store=False) # store=False: the bot never keeps this object around
+    view.add_item(ui.Button(label="◀️ Previous Page", style=discord.ButtonStyle.primary, custom_id=previous_id, disabled=page <= 0))
+    view.add_item(ui.Button(label="Next Page ▶️", style=discord.ButtonStyle.primary, custom_id=next_id, disabled=page >= total_pages - 1))
+    return view
+
+
+def clamp(page, total_pages):
+    # The list may have shrunk since the button was drawn
+    return max(0, min(page, total_pages - 1))
+
+
+async def handle(interaction):
+    # Answer a page button press; returns False if the interaction isn't one
+    if interaction.type is not discord.InteractionType.component:
+        return False
+    parsed = parse_custom_id(interaction.custom_id)
+    if parsed is None:
+        return False
+    kind, page, anchor, args = parsed
+    embed, view = await renderers[kind](interaction, page, anchor, *args)
+    await interaction.response.edit_message(embed=embed, view=view)
+    return True
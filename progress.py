@@ -0,0 +1,58 @@
+import json
+import time
+
+import scores
+from database import normalize_name
+
+
+def find_challenges(conn, guild_id, challenge_names):
+    # Look up many of a guild's challenges in one statement; returns {name_key: (challenge_id, points)}
+    keys = json.dumps([normalize_name(name) for name in challenge_names])
+    rows = conn.execute("""
+        SELECT name_key, challenge_id, points
+        FROM challenges
+        WHERE guild_id = ? AND name_key IN (SELECT value FROM json_each(?))
+    """, (guild_id, keys))
+    return {name_key: (challenge_id, points) for name_key, challenge_id, points in rows}
+
+
+def complete_challenges(conn, guild_id, user_ids, challenge_names):
+    """Mark every named challenge in the guild as completed for every user.
+
+    Runs a fixed number of statements per user no matter how many challenges are
+    named. Returns a list of (user_id, challenge_name, status, challenge_id) where
+    status is 'completed', 'already completed' or 'not found' (challenge_id is None then).
+    """
+    names = list(dict.fromkeys(normalize_name(name) for name in challenge_names if name.strip())) # dedupe, keep order
+    found = find_challenges(conn, guild_id, names)
+    challenge_ids = json.dumps([challenge_id for challenge_id, _ in found.values()])
+
+    completed_at = int(time.time())
+    results = []
+    for user_id in user_ids:
+        already_done = {row[0] for row in conn.execute("""
+            SELECT challenge_id FROM user_progress
+            WHERE guild_id = ? AND user_id = ? AND is_completed = 1 AND challenge_id IN (SELECT value FROM json_each(?))
+        """, (guild_id, user_id, challenge_ids))}
+
+        newly_completed = []
+        for name in names:
+            if name not in found:
+                results.append((user_id, name, 'not found', None))
+                continue
+            challenge_id, points = found[name]
+            if challenge_id in already_done:
+                results.append((user_id, name, 'already completed', challenge_id))
+                continue
+            newly_completed.append((challenge_id, points))
+            results.append((user_id, name, 'completed', challenge_id))
+
+        if newly_completed:
+            conn.executemany("""
+                INSERT INTO user_progress (guild_id, user_id, challenge_id, is_completed, completed_at) VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT(user_id, challenge_id) DO UPDATE SET is_completed = 1, completed_at = excluded.completed_at
+            """, [(guild_id, user_id, challenge_id, completed_at) for challenge_id, _ in newly_completed])
+            earned = sum(points for _, points in newly_completed)
+            scores.credit_user(conn, guild_id, user_id, earned, len(newly_completed))
+            scores.credit_periods(conn, guild_id, user_id, completed_at, earned, len(newly_completed))
+    return results
@@ -0,0 +1,277 @@
+import bisect
+import random
+import sys
+from array import array
+
+# Everything the remaining/random/stats commands need about one guild, in memory.
+# Challenges get dense slot numbers, and each user's completions are one int used as
+# a bitset over those slots, so "what's left for this user" is live & ~completed.
+
+
+class _Bitsets:
+    # The data behind a ProgressEngine; a load builds a new one and swaps it in
+
+    def __init__(self):
+        self.slots = {} # challenge_id -> slot
+        self.ids = [] # slot -> challenge_id, None once deleted
+        self.names = [] # slot -> challenge_name
+        self.points = array('q') # slot -> points
+        self.live = 0 # bitset of slots whose challenge still exists
+        self.order = [] # (-points, challenge_id, slot) of live challenges, the order lists are shown in
+        self.completed = {} # user_id -> bitset of completed slots (may include deleted slots; mask with live)
+        self.recent = {} # user_id -> slot of the challenge completed last
+        self.by_points = {} # points -> bitset of live slots with that many points, for weighted picks
+
+    def add_challenge(self, challenge_id, challenge_name, points):
+        if challenge_id in self.slots:
+            return
+        # Slots aren't reused after a delete, so users' old bits for them never need clearing
+        slot = self.slots[challenge_id] = len(self.ids)
+        self.ids.append(challenge_id)
+        self.names.append(challenge_name)
+        self.points.append(points)
+        self.live |= 1 << slot
+        bisect.insort(self.order, (-points, challenge_id, slot))
+        self.by_points[points] = self.by_points.get(points, 0) | 1 << slot
+
+    def remove_challenge(self, challenge_id):
+        slot = self.slots.pop(challenge_id, None)
+        if slot is None:
+            return
+        self.ids[slot] = None
+        self.live &= ~(1 << slot)
+        del self.order[bisect.bisect_left(self.order, (-self.points[slot], challenge_id, slot))]
+        bits = self.by_points.pop(self.points[slot]) & ~(1 << slot)
+        if bits:
+            self.by_points[self.points[slot]] = bits
+
+    def complete(self, user_id, challenge_ids):
+        bits = self.completed.get(user_id, 0)
+        for challenge_id in challenge_ids:
+            slot = self.slots.get(challenge_id)
+            if slot is not None:
+                bits |= 1 << slot
+                self.recent[user_id] = slot
+        self.completed[user_id] = bits
+
+    def max_challenge_id(self):
+        # Ids only grow within a guild's live challenges, so the highest live slot has the highest id
+        return self.ids[self.live.bit_length() - 1] if self.live else 0
+
+
+def _weight(points, weighting):
+    # weighting=None picks uniformly; 'high' favors challenges in proportion to their points and 'low' to 1/points
+    if weighting == 'high':
+        return max(points, 1)
+    if weighting == 'low':
+        return 1 / max(points, 1)
+    return 1
+
+
+def set_bits(bits):
+    # Slots of the set bits in a bitset, lowest first; skips 64 empty slots at a time
+    words = array('Q', bits.to_bytes((bits.bit_length() + 63) // 64 * 8, 'little'))
+    if sys.byteorder == 'big':
+        words.byteswap()
+    for word_index, word in enumerate(words):
+        while word:
+            low = word & -word
+            yield word_index * 64 + low.bit_length() - 1
+            word ^= low
+
+
+def nth_set_bit(bits, n):
+    # Slot of the n-th (0-based) set bit
+    words = array('Q', bits.to_bytes((bits.bit_length() + 63) // 64 * 8, 'little'))
+    if sys.byteorder == 'big':
+        words.byteswap()
+    for word_index, word in enumerate(words):
+        count = word.bit_count()
+        if n >= count:
+            n -= count
+            continue
+        for _ in range(n):
+            word &= word - 1 # drop the lowest set bit
+        return word_index * 64 + (word & -word).bit_length() - 1
+    raise IndexError(n)
+
+
+class ProgressEngine:
+    """In-memory challenge catalog and completion bitsets for one guild.
+
+    load() reads the guild's challenges and completions once; after that, the write
+    paths keep it current (complete(), remove_challenge(), sync_challenges()) and the
+    remaining/random/stats commands are answered without SQL. A user's bitset takes
+    about one bit per challenge in the catalog, see memory().
+
+    Writes that land while a load is reading are replayed onto its result, and every
+    update is idempotent, so it doesn't matter whether the load already saw them.
+    """
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.loaded = False
+        self._data = _Bitsets()
+        self._pending = None # updates made while any load is running, as (method name, args)
+        self._loads = 0 # loads in progress
+
+    def _read(self, conn):
+        data = _Bitsets()
+        for challenge_id, challenge_name, points in conn.execute("SELECT challenge_id, challenge_name, points FROM challenges WHERE guild_id = ? ORDER BY challenge_id", (self.guild_id,)):
+            data.add_challenge(challenge_id, challenge_name, points)
+        # Oldest first, so each user's most recent completion is applied last
+        rows = conn.execute("""
+            SELECT user_id, challenge_id FROM user_progress
+            WHERE guild_id = ? AND is_completed = 1
+            ORDER BY completed_at IS NOT NULL, completed_at, rowid
+        """, (self.guild_id,))
+        completed = {}
+        for user_id, challenge_id in rows:
+            slot = data.slots.get(challenge_id)
+            if slot is not None:
+                user_id = int(user_id)
+                completed[user_id] = completed.get(user_id, 0) | 1 << slot
+                data.recent[user_id] = slot
+        data.completed = completed
+        return data
+
+    async def load(self, db):
+        # Build the engine from the database (on a database thread) and swap it in.
+        # Loads can overlap (e.g. a cache invalidation starts a second one), so they share
+        # one pending list, cleared only when the last of them finishes.
+        if not self._loads:
+            self._pending = []
+        self._loads += 1
+        try:
+            data = await db.run(self._read)
+            for name, args in self._pending:
+                if name == 'sync':
+                    continue # done below, once the new data is in place
+                getattr(data, name)(*args)
+            resync = any(name == 'sync' for name, _ in self._pending)
+            self._data = data
+            self.loaded = True
+        finally:
+            self._loads -= 1
+            if not self._loads:
+                self._pending = None
+        if resync:
+            await self.sync_challenges(db)
+        return len(data.slots)
+
+    def _update(self, name, *args):
+        if self._pending is not None:
+            self._pending.append((name, args))
+        if self.loaded:
+            getattr(self._data, name)(*args)
+
+    def complete(self, user_id, challenge_ids):
+        # Call after a transaction that completed challenges for a user commits
+        self._update('complete', int(user_id), list(challenge_ids))
+
+    def remove_challenge(self, challenge_id):
+        # Call after a transaction that deleted a challenge commits
+        self._update('remove_challenge', challenge_id)
+
+    async def sync_challenges(self, db):
+        # Call after challenges were added or imported: picks up the guild's challenges newer than any we have
+        if self._pending is not None:
+            self._pending.append(('sync', ()))
+            return
+        if not self.loaded:
+            return # the load will read them
+        rows = await db.fetchall(
+            "SELECT challenge_id, challenge_name, points FROM challenges WHERE guild_id = ? AND challenge_id > ? ORDER BY challenge_id",
+            (self.guild_id, self._data.max_challenge_id()),
+        )
+        for row in rows:
+            self._data.add_challenge(*row)
+
+    def _remaining_bits(self, user_id):
+        data = self._data
+        return data.live & ~data.completed.get(int(user_id), 0)
+
+    def user_stats(self, user_id):
+        """Returns (completed count, completed points, most recent (name, points) or None).
+
+        The most recent challenge is None if it was deleted since, even when the user has
+        completed others; the caller can look that one up in the database.
+        """
+        data = self._data
+        user_id = int(user_id)
+        bits = data.completed.get(user_id, 0) & data.live
+        points = sum(data.points[slot] for slot in set_bits(bits))
+        slot = data.recent.get(user_id)
+        recent = (data.names[slot], data.points[slot]) if slot is not None and data.ids[slot] is not None else None
+        return bits.bit_count(), points, recent
+
+    def remaining_count(self, user_id):
+        return self._remaining_bits(user_id).bit_count()
+
+    def remaining_page(self, user_id, page_number, page_size=10, anchor=None):
+        """One page of a user's remaining challenges as [(challenge_id, challenge_name, points)],
+        ordered by points (highest first) like ChallengePageSource.
+
+        anchor is ('after' | 'before', points, challenge_id) of the row next to the page,
+        as in ChallengePageSource.get_page; without one, earlier pages are skipped over.
+        """
+        data = self._data
+        remaining = self._remaining_bits(user_id)
+        if not remaining:
+            return []
+        remaining = remaining.to_bytes((remaining.bit_length() + 7) // 8, 'little')
+        is_remaining = lambda slot: slot >> 3 < len(remaining) and remaining[slot >> 3] >> (slot & 7) & 1
+        order = data.order
+
+        if anchor is not None and anchor[0] == 'before':
+            _, points, challenge_id = anchor
+            rows = []
+            for position in range(bisect.bisect_left(order, (-points, challenge_id)) - 1, -1, -1):
+                if is_remaining(order[position][2]):
+                    rows.append(order[position])
+                    if len(rows) == page_size:
+                        break
+            rows.reverse()
+        else:
+            if anchor is not None:
+                _, points, challenge_id = anchor
+                position, skip = bisect.bisect_right(order, (-points, challenge_id, sys.maxsize)), 0
+            else:
+                position, skip = 0, page_number * page_size
+            rows = []
+            for position in range(position, len(order)):
+                if not is_remaining(order[position][2]):
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                rows.append(order[position])
+                if len(rows) == page_size:
+                    break
+        return [(challenge_id, data.names[slot], -negative_points) for negative_points, challenge_id, slot in rows]
+
+    def pick_random(self, user_id, weighting=None):
+        """Returns a random (challenge_name, points) the user hasn't completed, or None.
+
+        weighting=None picks uniformly, 'high' and 'low' as in _weight. A weighted pick
+        first draws a points value, weighted by its weight times how many remaining
+        challenges have it, then a uniform challenge among those (the n-th set bit), so
+        it takes one pass over the distinct points values and never lists the remaining set.
+        """
+        data = self._data
+        remaining = self._remaining_bits(user_id)
+        count = remaining.bit_count()
+        if not count:
+            return None
+        if weighting:
+            groups = [remaining & bits for bits in data.by_points.values()]
+            weights = [group.bit_count() * _weight(points, weighting) for points, group in zip(data.by_points, groups)]
+            remaining = random.choices(groups, weights)[0]
+            count = remaining.bit_count()
+        slot = nth_set_bit(remaining, random.randrange(count))
+        return data.names[slot], data.points[slot]
+
+    def memory(self):
+        # (users, bytes held by their bitsets); the catalog arrays are shared by all users
+        bitsets = self._data.completed.values()
+        return len(self._data.completed), sum(sys.getsizeof(bits) for bits in bitsets)
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class ReadCache:
+    """Read-through cache for command results, with single-flight loading.
+
+    Concurrent get() calls for the same key share one computation, and its result
+    is reused for ttl seconds. Entries belong to a scope (a guild id); invalidate(scope)
+    bumps the scope's generation, which is part of every key, so entries and
+    computations from before the change are never handed out again and simply age
+    out of the LRU. Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, ttl=10, max_entries=2048):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0 # callers that waited on another caller's computation
+        self._entries = OrderedDict() # full key -> (expires_at, value)
+        self._inflight = {} # full key -> asyncio.Task
+        self._generations = {} # scope -> int
+
+    def _full_key(self, scope, key):
+        return (scope, self._generations.get(scope, 0), *key)
+
+    async def get(self, scope, key, compute):
+        # Return the cached value for key, or await compute() (shared with concurrent callers) and cache it
+        full_key = self._full_key(scope, key)
+        entry = self._entries.get(full_key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(full_key)
+                return value
+            del self._entries[full_key]
+        value = await self._load(full_key, compute)
+        self._entries[full_key] = (time.monotonic() + self.ttl, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    async def coalesce(self, scope, key, compute):
+        # Like get(), but only shares the in-flight computation; the result isn't kept
+        return await self._load(self._full_key(scope, key), compute)
+
+    async def _load(self, full_key, compute):
+        task = self._inflight.get(full_key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # Its own task, so the first caller being cancelled doesn't cancel it for everyone else
+            task = self._inflight[full_key] = asyncio.ensure_future(compute())
+            task.add_done_callback(lambda task: self._finished(full_key, task))
+        return await asyncio.shield(task) # a cancelled waiter only stops waiting
+
+    def _finished(self, full_key, task):
+        if self._inflight.get(full_key) is task:
+            del self._inflight[full_key]
+        if not task.cancelled():
+            task.exception() # mark it retrieved, so asyncio doesn't warn when every waiter was cancelled
+
+    def invalidate(self, scope):
+        self._generations[scope] = self._generations.get(scope, 0) + 1
+
+    def clear(self):
+        self._entries.clear()
+        self._generations.clear()
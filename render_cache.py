@@ -0,0 +1,34 @@
+from collections import OrderedDict
+
+
+class RenderCache:
+    """LRU cache for rendered pages (embed dicts) and page counts.
+
+    Keys include the catalog version (and, for per-user views, the user's progress
+    version), so a change never has to find and delete stale entries: later requests
+    simply use new keys and the old entries fall off the end of the LRU.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
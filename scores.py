@@ -0,0 +1,205 @@
+import functools
+import time
+from datetime import datetime, timezone
+
+# Helpers for the user_scores and score_rollups aggregate tables. All of these take a
+# connection and are meant to run inside the same transaction as the progress change
+# they account for. Scores are kept per guild: every function works inside one guild's partition.
+#
+# user_scores holds all-time totals. score_rollups holds the same totals per UTC day,
+# week (from Monday) and season (calendar quarter), keyed by when the window started,
+# so a windowed leaderboard reads one small partition however much history there is.
+# Completions recorded before timestamps existed only count towards all-time totals.
+
+PERIODS = ('day', 'week', 'season')
+
+
+@functools.lru_cache(maxsize=1024)
+def _season_start(day):
+    start = datetime.fromtimestamp(day, timezone.utc)
+    return int(start.replace(month=(start.month - 1) // 3 * 3 + 1, day=1).timestamp())
+
+
+def period_start(period, timestamp):
+    # Unix time at which the day, week or season containing timestamp began
+    day = int(timestamp) // 86400 * 86400
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - (day // 86400 + 3) % 7 * 86400 # 1970-01-01 was a Thursday
+    return _season_start(day)
+
+
+def current_window(period, now=None):
+    # None for all-time, otherwise (period, start) of the window now falls in; pass it to the readers below
+    if period not in PERIODS:
+        return None
+    return period, period_start(period, time.time() if now is None else now)
+
+
+def _board(guild_id, window):
+    # FROM/WHERE and parameters of one leaderboard: all-time totals or one rollup window
+    if window is None:
+        return "user_scores WHERE guild_id = ?", (guild_id,)
+    return "score_rollups WHERE guild_id = ? AND period = ? AND period_start = ?", (guild_id, *window)
+
+
+def credit_user(conn, guild_id, user_id, points, completed=1):
+    # Add points (and completed challenge count) to a user's running total
+    conn.execute("""
+        INSERT INTO user_scores (guild_id, user_id, points, completed) VALUES (?, ?, ?, ?)
+        ON CONFLICT(guild_id, user_id) DO UPDATE SET
+            points = points + excluded.points,
+            completed = completed + excluded.completed
+    """, (guild_id, user_id, points, completed))
+
+
+def credit_periods(conn, guild_id, user_id, completed_at, points, completed=1):
+    # Add points completed at completed_at to the user's day, week and season rollups
+    conn.executemany("""
+        INSERT INTO score_rollups (guild_id, period, period_start, user_id, points, completed) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(guild_id, period, period_start, user_id) DO UPDATE SET
+            points = points + excluded.points,
+            completed = completed + excluded.completed
+    """, [(guild_id, period, period_start(period, completed_at), user_id, points, completed) for period in PERIODS])
+
+
+def remove_challenge_points(conn, guild_id, challenge_id, points):
+    # Take a deleted challenge's points back from everyone who completed it, in every window it counted in
+    completions = conn.execute("SELECT user_id, completed_at FROM user_progress WHERE challenge_id = ? AND is_completed = 1 AND completed_at IS NOT NULL", (challenge_id,)).fetchall()
+    for user_id, completed_at in completions:
+        credit_periods(conn, guild_id, user_id, completed_at, -points, -1)
+    conn.execute("""
+        UPDATE user_scores
+        SET points = points - ?, completed = completed - 1
+        WHERE guild_id = ? AND user_id IN (
+            SELECT user_id FROM user_progress WHERE challenge_id = ? AND is_completed = 1
+        )
+    """, (points, guild_id, challenge_id))
+
+
+def top_scores(conn, guild_id, limit, offset=0, window=None):
+    board, params = _board(guild_id, window)
+    return conn.execute(f"""
+        SELECT user_id, points
+        FROM {board} AND completed > 0
+        ORDER BY points DESC, user_id
+        LIMIT ? OFFSET ?
+    """, (*params, limit, offset)).fetchall()
+
+
+def count_ranked(conn, guild_id, window=None):
+    board, params = _board(guild_id, window)
+    return conn.execute(f"SELECT COUNT(*) FROM {board} AND completed > 0", params).fetchone()[0]
+
+
+def user_rank(conn, guild_id, user_id, window=None):
+    # Returns (rank, points) for a user, or None if they haven't completed anything (in the window)
+    board, params = _board(guild_id, window)
+    row = conn.execute(f"SELECT points FROM {board} AND user_id = ? AND completed > 0", (*params, user_id)).fetchone()
+    if row is None:
+        return None
+    points = row[0]
+    higher = conn.execute(f"SELECT COUNT(*) FROM {board} AND points > ? AND completed > 0", (*params, points)).fetchone()[0]
+    return higher + 1, points
+
+
+def user_stats(conn, guild_id, user_id):
+    """Returns (completed count, completed points, most recent (name, points) or None) in one query.
+
+    The most recent challenge is the one with the latest completed_at. Completions recorded
+    before timestamps existed count as older than any timestamped one.
+    """
+    count, points, recent_name, recent_points = conn.execute("""
+        SELECT COUNT(*), COALESCE(SUM(challenges.points), 0), recent.challenge_name, recent.points
+        FROM user_progress
+        INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
+        LEFT JOIN (
+            SELECT challenges.challenge_name, challenges.points
+            FROM user_progress
+            INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
+            WHERE user_progress.guild_id = ? AND user_progress.user_id = ? AND user_progress.is_completed = 1
+            ORDER BY user_progress.completed_at IS NULL, user_progress.completed_at DESC, user_progress.rowid DESC
+            LIMIT 1
+        ) recent
+        WHERE user_progress.guild_id = ? AND user_progress.user_id = ? AND user_progress.is_completed = 1
+    """, (guild_id, user_id, guild_id, user_id)).fetchone()
+    recent = (recent_name, recent_points) if recent_name is not None else None
+    return count, points, recent
+
+
+def _computed_scores(conn, guild_id):
+    return conn.execute("""
+        SELECT user_progress.user_id, SUM(challenges.points), COUNT(*)
+        FROM user_progress
+        INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
+        WHERE user_progress.guild_id = ? AND user_progress.is_completed = 1
+        GROUP BY user_progress.user_id
+    """, (guild_id,)).fetchall()
+
+
+def verify_scores(conn, guild_id):
+    # Compare a guild's user_scores against a full recomputation; returns a list of
+    # (user_id, stored (points, completed), expected (points, completed)) mismatches
+    expected = {str(user_id): (points, completed) for user_id, points, completed in _computed_scores(conn, guild_id)}
+    stored = {str(user_id): (points, completed) for user_id, points, completed in conn.execute("SELECT user_id, points, completed FROM user_scores WHERE guild_id = ?", (guild_id,))}
+    mismatches = []
+    for user_id in expected.keys() | stored.keys():
+        have = stored.get(user_id, (0, 0))
+        want = expected.get(user_id, (0, 0))
+        if have != want:
+            mismatches.append((user_id, have, want))
+    return mismatches
+
+
+def _computed_rollups(conn, guild_id):
+    # {(period, period_start, user_id): [points, completed]} recomputed from user_progress
+    rows = conn.execute("""
+        SELECT user_progress.user_id, user_progress.completed_at, challenges.points
+        FROM user_progress
+        INNER JOIN challenges ON user_progress.challenge_id = challenges.challenge_id
+        WHERE user_progress.guild_id = ? AND user_progress.is_completed = 1 AND user_progress.completed_at IS NOT NULL
+    """, (guild_id,))
+    totals = {}
+    for user_id, completed_at, points in rows:
+        for period in PERIODS:
+            total = totals.setdefault((period, period_start(period, completed_at), user_id), [0, 0])
+            total[0] += points
+            total[1] += 1
+    return totals
+
+
+def verify_rollups(conn, guild_id):
+    # Compare a guild's score_rollups against a full recomputation; returns a list of
+    # ((period, period_start, user_id), stored (points, completed), expected (points, completed))
+    # mismatches. A row that went back to zero counts the same as a missing one.
+    expected = {(period, start, str(user_id)): tuple(total) for (period, start, user_id), total in _computed_rollups(conn, guild_id).items()}
+    stored = {
+        (period, start, str(user_id)): (points, completed)
+        for period, start, user_id, points, completed in conn.execute("SELECT period, period_start, user_id, points, completed FROM score_rollups WHERE guild_id = ?", (guild_id,))
+    }
+    mismatches = []
+    for key in expected.keys() | stored.keys():
+        have = stored.get(key, (0, 0))
+        want = expected.get(key, (0, 0))
+        if have != want:
+            mismatches.append((key, have, want))
+    return mismatches
+
+
+def rebuild_rollups(conn, guild_id):
+    # Throw away a guild's score_rollups and recompute them from user_progress
+    conn.execute("DELETE FROM score_rollups WHERE guild_id = ?", (guild_id,))
+    conn.executemany(
+        "INSERT INTO score_rollups (guild_id, period, period_start, user_id, points, completed) VALUES (?, ?, ?, ?, ?, ?)",
+        [(guild_id, *key, *total) for key, total in _computed_rollups(conn, guild_id).items()],
+    )
+
+
+def rebuild_scores(conn, guild_id):
+    # Throw away a guild's user_scores and rollups and recompute them from user_progress; returns the number of users
+    conn.execute("DELETE FROM user_scores WHERE guild_id = ?", (guild_id,))
+    rows = _computed_scores(conn, guild_id)
+    conn.executemany("INSERT INTO user_scores (guild_id, user_id, points, completed) VALUES (?, ?, ?, ?)", [(guild_id, *row) for row in rows])
+    rebuild_rollups(conn, guild_id)
+    return len(rows)
@@ -0,0 +1,145 @@
+import bisect
+import itertools
+import threading
+from collections import Counter
+
+from database import normalize_name
+
+
+def trigrams(text):
+    # Character trigrams of each word, padded so short words and word starts still match
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SearchIndex:
+    """In-memory fuzzy search over one guild's challenge names.
+
+    A trigram inverted index picks a shortlist of candidate names, and only that
+    shortlist is scored with fuzzywuzzy, so search cost depends on how many names
+    look similar to the query rather than on the size of the catalog. At most
+    max_postings index entries are read per search (rarest trigrams first), so a
+    query made of very common trigrams is capped too.
+
+    The normalized names are also kept in a sorted list for autocomplete: the names
+    starting with what the user has typed so far are one bisect away.
+
+    load() and search() run on worker threads while add()/remove() may be called
+    from the event loop; updates made during a load are replayed onto the new index
+    once it is swapped in, so none are lost.
+    """
+
+    def __init__(self, guild_id, shortlist_size=200, max_postings=20000):
+        self.guild_id = guild_id
+        self.shortlist_size = shortlist_size
+        self.max_postings = max_postings
+        self.loaded = False
+        self._entries = {} # name_key -> (challenge_name, points)
+        self._postings = {} # trigram -> set of name_keys
+        self._sorted_keys = [] # every name_key, in order
+        self._lock = threading.Lock() # guards the index while load() swaps it in or search() reads it
+        self._pending = None # (method, args) of updates made while any load is reading, else None
+        self._loads = 0 # loads in progress
+
+    def load(self, conn):
+        # Rebuild the index from the guild's challenges (runs on a database thread).
+        # The new index is built on the side and swapped in, so searches never see half of it.
+        with self._lock:
+            if not self._loads:
+                self._pending = []
+            self._loads += 1
+        try:
+            entries = {}
+            postings = {}
+            for challenge_name, points in conn.execute("SELECT challenge_name, points FROM challenges WHERE guild_id = ?", (self.guild_id,)):
+                _index_name(entries, postings, challenge_name, points)
+            with self._lock:
+                self._entries, self._postings, self._sorted_keys = entries, postings, sorted(entries)
+                # add() and remove() are idempotent, so it doesn't matter whether the read above already saw these
+                for method, args in self._pending:
+                    method(*args)
+                self.loaded = True
+        finally:
+            with self._lock:
+                self._loads -= 1
+                if not self._loads:
+                    self._pending = None
+        return len(entries)
+
+    def add(self, challenge_name, points):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self._add, (challenge_name, points)))
+            self._add(challenge_name, points)
+
+    def remove(self, challenge_name):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self._remove, (challenge_name,)))
+            self._remove(challenge_name)
+
+    def _add(self, challenge_name, points):
+        key = normalize_name(challenge_name)
+        if key not in self._entries:
+            bisect.insort(self._sorted_keys, key)
+        _index_name(self._entries, self._postings, challenge_name, points)
+
+    def _remove(self, challenge_name):
+        key = normalize_name(challenge_name)
+        if self._entries.pop(key, None) is None:
+            return
+        del self._sorted_keys[bisect.bisect_left(self._sorted_keys, key)]
+        for gram in trigrams(key):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def _shortlist(self, key):
+        # {name_key: (challenge_name, points)} of the candidates, copied so scoring can run without the lock
+        with self._lock:
+            postings = sorted((self._postings.get(gram, ()) for gram in trigrams(key)), key=len)
+            hits = Counter()
+            budget = self.max_postings
+            for keys in postings:
+                if budget <= 0:
+                    break
+                hits.update(itertools.islice(keys, budget))
+                budget -= len(keys)
+            return {candidate: self._entries[candidate] for candidate, _ in hits.most_common(self.shortlist_size)}
+
+    def search(self, keyword, limit=20, min_score=50):
+        # Returns [(challenge_name, points)] for the best matches, best first.
+        # CPU-bound: call it off the event loop (see pages.SearchPageSource).
+        from fuzzywuzzy import process # imported on first use (or during warm-up), not at startup
+        shortlist = self._shortlist(normalize_name(keyword))
+        if not shortlist:
+            return []
+        choices = {key: challenge_name for key, (challenge_name, _) in shortlist.items()}
+        matches = process.extract(keyword, choices, limit=limit)
+        return [shortlist[key] for _, score, key in matches if score >= min_score]
+
+    def prefix_matches(self, prefix, limit=25, exclude=frozenset()):
+        # Up to limit challenge names whose normalized name starts with prefix, in
+        # alphabetical order, skipping name_keys in exclude. Each excluded key costs at
+        # most one extra step, so this stays fast however big the catalog is.
+        prefix = normalize_name(prefix)
+        start = bisect.bisect_left(self._sorted_keys, prefix)
+        names = []
+        for key in self._sorted_keys[start:start + limit + len(exclude)]:
+            if not key.startswith(prefix) or len(names) >= limit:
+                break
+            if key not in exclude:
+                names.append(self._entries[key][0])
+        return names
+
+
+def _index_name(entries, postings, challenge_name, points):
+    key = normalize_name(challenge_name)
+    entries[key] = (challenge_name, points)
+    for gram in trigrams(key):
+        postings.setdefault(gram, set()).add(key)